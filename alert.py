@@ -10,6 +10,14 @@ WATCH = "watch"
 ALERT = "alert"
 URGENT = "urgent"
 
+# 回放时把所有告警/通知改投到这里，不发飞书：fn(level, message)
+_sink = None
+
+
+def set_sink(fn):
+    global _sink
+    _sink = fn
+
 
 def evaluate_alerts(baby_state, transitions):
     """根据状态和转换评估告警"""
@@ -63,6 +71,10 @@ def send_alert(alert):
     level = alert["level"]
     message = alert["message"]
 
+    if _sink:
+        _sink(level, message)
+        return
+
     if level == NORMAL:
         print(f"  📝 {message}")
         return
@@ -78,6 +90,10 @@ def send_alert(alert):
 
 def notify_feishu(message):
     """通过飞书群机器人 webhook 通知，失败降级到 OpenClaw hook"""
+    if _sink:
+        _sink("notify", message)
+        return
+
     # 主渠道：飞书群机器人
     try:
         r = requests.post(
@@ -0,0 +1,187 @@
+"""本地统计：从日志记录精确算出睡眠/活动/房间/外出，不经过 LLM
+
+日志行格式（analyze.py 写入）：
+    - 07:10 [sleeping] | 卧室 | 一直在婴儿床里睡觉 | 无人 | 夜视
+    - 07:20 | (无变化) 延续: sleeping
+      - ⚡ EVENT: 出门
+"""
+
+import re
+from datetime import datetime
+
+from config import LOG_DIR, ANALYZE_EVERY_MIN
+
+LINE_RE = re.compile(r"^- (\d{1,2}):(\d{2})(?: \[(\w+)\])? \| (.*)$")
+SKIP_RE = re.compile(r"\(无变化\) 延续: (\w+)")
+EVENT_RE = re.compile(r"^\s+- ⚡ EVENT: (.+)$")
+
+# 两条记录间隔超过此值视为中间没在监控（夜间停机、进程挂了），不计入时长
+MAX_GAP_MIN = 3 * ANALYZE_EVERY_MIN
+
+
+def day_log_path(day):
+    return LOG_DIR / f"ruirui_{day}.md"
+
+
+def normalize_room(room):
+    """'客厅→卧室' 取最后所在房间"""
+    return room.split("→")[-1].strip() if room else "unknown"
+
+
+def parse_line(line):
+    """解析一行日志，返回记录 dict；EVENT 行返回 {"event": ...}；其他返回 None"""
+    m = EVENT_RE.match(line)
+    if m:
+        return {"event": m.group(1).strip()}
+    m = LINE_RE.match(line)
+    if not m:
+        return None
+    hh, mm, status, rest = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+    rec = {"time": f"{hh:02d}:{mm:02d}", "minute": hh * 60 + mm, "event": None}
+    skip = SKIP_RE.search(rest)
+    if skip:
+        rec.update(kind="skip", status=skip.group(1))
+        return rec
+    parts = [p.strip() for p in rest.split("|")]
+    rec.update(kind="analyze", status=status or "unknown",
+               room=normalize_room(parts[0]),
+               description=parts[1] if len(parts) > 1 else "",
+               companion=parts[2] if len(parts) > 2 else "",
+               light=parts[3] if len(parts) > 3 else "")
+    return rec
+
+
+def parse_log(text):
+    """解析整天日志为记录列表（EVENT 挂到上一条记录上；跳过记录沿用上一条的房间）"""
+    records = []
+    for line in text.splitlines():
+        rec = parse_line(line)
+        if rec is None:
+            continue
+        if "time" not in rec:
+            if records:
+                records[-1]["event"] = rec["event"]
+            continue
+        if rec["kind"] == "skip" and records:
+            prev = records[-1]
+            for k in ("room", "companion", "light"):
+                rec.setdefault(k, prev.get(k, ""))
+        records.append(rec)
+    return records
+
+
+def build_segments(records, end_minute=None):
+    """相邻同状态记录合并成段：[{status, room, start, end, minutes}]
+
+    每条记录覆盖到下一条记录（最长 MAX_GAP_MIN）；最后一条覆盖一个分析周期，
+    end_minute 给定时截断（当天还没结束）。
+    """
+    segments = []
+    for i, rec in enumerate(records):
+        start = rec["minute"]
+        nxt = records[i + 1]["minute"] if i + 1 < len(records) else start + ANALYZE_EVERY_MIN
+        if end_minute is not None:
+            nxt = min(nxt, max(end_minute, start))
+        end = min(nxt, start + MAX_GAP_MIN)
+        room = rec.get("room", "unknown")
+        last = segments[-1] if segments else None
+        if last and last["status"] == rec["status"] and last["end"] == start:
+            last["end"] = end
+            last["rooms"][room] = last["rooms"].get(room, 0) + end - start
+        else:
+            segments.append({"status": rec["status"], "start": start, "end": end,
+                             "rooms": {room: end - start}})
+    for seg in segments:
+        seg["minutes"] = seg["end"] - seg["start"]
+        seg["room"] = max(seg["rooms"], key=seg["rooms"].get)
+    return segments
+
+
+def fmt_minute(m):
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def compute_stats(records, end_minute=None):
+    """全天统计数字"""
+    segments = build_segments(records, end_minute)
+    naps = [s for s in segments if s["status"] == "sleeping"]
+    by_status, by_room = {}, {}
+    for seg in segments:
+        by_status[seg["status"]] = by_status.get(seg["status"], 0) + seg["minutes"]
+        if seg["status"] != "out":
+            for room, m in seg["rooms"].items():
+                by_room[room] = by_room.get(room, 0) + m
+
+    # 外出：出门事件到下一次回来事件
+    outings, out_start = [], None
+    for rec in records:
+        if rec["event"] == "出门" and out_start is None:
+            out_start = rec["minute"]
+        elif rec["event"] == "回来" and out_start is not None:
+            outings.append({"start": out_start, "end": rec["minute"],
+                            "minutes": rec["minute"] - out_start})
+            out_start = None
+    if out_start is not None:
+        outings.append({"start": out_start, "end": None, "minutes": None})
+
+    awake = sum(m for st, m in by_status.items() if st not in ("sleeping", "unknown", "out"))
+    return {
+        "first": records[0]["time"] if records else None,
+        "last": records[-1]["time"] if records else None,
+        "records": len(records),
+        "analyzed": sum(1 for r in records if r["kind"] == "analyze"),
+        "naps": [{"start": fmt_minute(n["start"]), "end": fmt_minute(n["end"]),
+                  "minutes": n["minutes"], "room": n["room"]} for n in naps],
+        "nap_count": len(naps),
+        "sleep_min": by_status.get("sleeping", 0),
+        "awake_min": awake,
+        "alone_awake_min": by_status.get("alone_awake", 0),
+        "status_min": by_status,
+        "room_min": by_room,
+        "outings": [{"start": fmt_minute(o["start"]),
+                     "end": fmt_minute(o["end"]) if o["end"] is not None else None,
+                     "minutes": o["minutes"]} for o in outings],
+        "segments": [{"status": s["status"], "room": s["room"], "start": fmt_minute(s["start"]),
+                      "end": fmt_minute(s["end"]), "minutes": s["minutes"]} for s in segments],
+    }
+
+
+def day_stats(day=None):
+    """读某天日志并统计；今天的统计截止到当前时间"""
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    path = day_log_path(day)
+    text = path.read_text(encoding="utf-8") if path.exists() else ""
+    end_minute = None
+    if day == datetime.now().strftime("%Y-%m-%d"):
+        now = datetime.now()
+        end_minute = now.hour * 60 + now.minute
+    return compute_stats(parse_log(text), end_minute)
+
+
+def fmt_duration(minutes):
+    if minutes is None:
+        return "未回"
+    h, m = divmod(int(minutes), 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m"
+
+
+def format_digest(stats):
+    """给 LLM 看的紧凑摘要（也是 --no-llm 的输出）"""
+    if not stats["records"]:
+        return "无记录"
+    lines = [
+        f"记录 {stats['first']}-{stats['last']}，共{stats['records']}条（Gemini 分析{stats['analyzed']}次）",
+        f"睡眠 {fmt_duration(stats['sleep_min'])}，共{stats['nap_count']}觉："
+        + ("、".join(f"{n['start']}-{n['end']}({fmt_duration(n['minutes'])})" for n in stats["naps"]) or "无"),
+        f"清醒 {fmt_duration(stats['awake_min'])}，其中独自清醒 {fmt_duration(stats['alone_awake_min'])}",
+        "状态时长：" + "、".join(f"{k} {fmt_duration(v)}" for k, v in
+                              sorted(stats["status_min"].items(), key=lambda x: -x[1])),
+        "房间停留：" + "、".join(f"{k} {fmt_duration(v)}" for k, v in
+                              sorted(stats["room_min"].items(), key=lambda x: -x[1])),
+        f"外出 {len(stats['outings'])}次："
+        + ("、".join(f"{o['start']}-{o['end'] or '?'}({fmt_duration(o['minutes'])})"
+                    for o in stats["outings"]) or "无"),
+        "时间线：",
+    ]
+    lines += [f"  {s['start']}-{s['end']} {s['status']}（{s['room']}）" for s in stats["segments"]]
+    return "\n".join(lines)
@@ -1,31 +1,41 @@
 """分析层：帧差检测 → Gemini 分析 → 状态机 → 告警 → EVENT检测"""
 
-import time, io, base64, json, requests
+import time, io, copy, base64, json, requests
 from datetime import datetime
 from pathlib import Path
 from PIL import Image, ImageChops
 
 from config import *
+import clock
 from state import load_baby_state, save_baby_state, parse_gemini_result, update_state
-from alert import evaluate_alerts, send_alert
-from door_check import check_door_event
+from alert import evaluate_alerts, send_alert, NORMAL
+from door_check import check_door_event, fetch_door_alarms
+from gemini import generate, RateLimited
+from capture import (load_thumb, thumb_diff, resolve_frame, list_frames, frame_label, worker_pool,
+                     frame_keys, save_state)
+import archive
+import noise
+import governor
+import ha
 
 
 # ── Gemini 成本估算 ──
 IMG_TOKENS = 258
 PROMPT_TOKENS = 800
 OUTPUT_TOKENS = 50
-INPUT_PRICE_PER_M = 1.25
-OUTPUT_PRICE_PER_M = 10.0
+MODEL_PRICES = {  # 每百万 token 美元：(输入, 缓存输入, 输出)
+    "gemini-2.5-pro": (1.25, 0.31, 10.0),
+    "gemini-2.5-flash": (0.30, 0.075, 2.50),
+}
+RECENT_CALLS_KEEP = 50
 
-PROMPT = """你看到的是家庭摄像头过去10分钟的截图（每2分钟一帧）。
+PROMPT_TEMPLATE = """你看到的是家庭摄像头过去10分钟的截图（每2分钟一帧）。
 文件名格式：摄像头_时间.jpg（如 bedroom_2230.jpg）
 
 目标：追踪8个月大婴儿"锐锐"的活动。
 
 摄像头说明：
-- bedroom = 卧室（婴儿房，粉色墙，蚊帐婴儿床）
-- living = 客厅（活动区，彩色玩具）
+{camera_lines}
 
 关键识别：
 - 锐锐8个月大，不会走路站立！只会躺、坐、爬、趴
@@ -39,18 +49,28 @@ PROMPT = """你看到的是家庭摄像头过去10分钟的截图（每2分钟
 - 彩色画面 = 开灯；黑白画面 = 关灯/夜视模式
 
 输出格式（严格一行）：
-房间 | 活动描述 | 陪伴情况 | 环境光线
+房间 | 活动描述 | 陪伴情况 | 环境光线 | 置信度
 
 陪伴情况：无人、大人、妈妈、爸爸、家属、不确定
 环境光线：明亮、暗、夜视 等
+置信度：高（画面清楚、判断明确）、中、低（看不清、有歧义）
 
 示例：
-卧室 | 一直在婴儿床里睡觉 | 无人 | 关灯、夜视
-客厅→卧室 | 前5分钟客厅玩耍，后被抱回卧室睡觉 | 妈妈 | 明亮
+卧室 | 一直在婴儿床里睡觉 | 无人 | 关灯、夜视 | 高
+客厅→卧室 | 前5分钟客厅玩耍，后被抱回卧室睡觉 | 妈妈 | 明亮 | 中
 
 只输出一行，不要多余文字。"""
 
 
+def build_prompt():
+    """按注册表拼摄像头说明（注册表不变则 PROMPT 不变，指令缓存可复用）"""
+    lines = [f"- {name} = {cam['description']}" for name, cam in cameras("indoor")]
+    return PROMPT_TEMPLATE.replace("{camera_lines}", "\n".join(lines))
+
+
+PROMPT = build_prompt()
+
+
 # ── 工具函数 ──
 
 def load_tracker_state():
@@ -61,11 +81,19 @@ def load_tracker_state():
 
 
 def save_tracker_state(state):
-    STATE_FILE.write_text(json.dumps(state, default=str))
+    """baby 由 state.py 单独读写，这里只合并其余字段，避免用本轮开头读到的旧 baby 覆盖；
+    摄像头帧字段 stream 模式下由 stream.py 随时更新，也不覆盖"""
+    try:
+        data = json.loads(STATE_FILE.read_text())
+    except:
+        data = {}
+    skip = {"baby"} | {k for name in CAMERAS for k in frame_keys(name)}
+    data.update({k: v for k, v in state.items() if k not in skip})
+    save_state(data)
 
 
 def get_log_file():
-    return LOG_DIR / f"ruirui_{datetime.now().strftime('%Y-%m-%d')}.md"
+    return LOG_DIR / f"ruirui_{clock.now().strftime('%Y-%m-%d')}.md"
 
 
 def get_recent_logs(n=6):
@@ -86,38 +114,52 @@ def get_last_entry():
 
 
 def get_recent_captures(minutes=12):
+    result = {name: [] for name in CAMERAS}
     if not CAPTURE_DIR.exists():
-        return {"bedroom": [], "living": [], "door": []}
-    cutoff = time.time() - minutes * 60
+        return result
+    cutoff = clock.time() - minutes * 60
     files = sorted([
-        f for f in CAPTURE_DIR.glob("*.jpg")
+        f for f in list_frames()
         if f.stat().st_mtime >= cutoff
-    ], key=lambda f: f.name)
-    result = {"bedroom": [], "living": [], "door": []}
+    ], key=lambda f: f.stem)
     for f in files:
-        for cam in result:
-            if f.name.startswith(cam):
-                result[cam].append(f)
-                break
+        cam = f.stem.rsplit("_", 1)[0]
+        if cam in result:
+            result[cam].append(f)
     return result
 
 
+def camera_batch_diff(name, files):
+    """单个摄像头窗口内最早帧与最新帧的差异，返回 (diff, changed, 判定说明)
+
+    NOISE_ENABLED 时按该摄像头窗口尺度的噪声模型判定（见 noise.py），否则用固定阈值。
+    """
+    cam = CAMERAS[name]
+    if len(files) < 2:
+        return 0.0, False, ""
+    roi = cam.get("roi")
+    try:
+        first, last = load_thumb(files[0], roi), load_thumb(files[-1], roi)
+        if not NOISE_ENABLED:
+            diff = thumb_diff(first, last)
+            return diff, diff > cam["threshold"], ""
+        diff = noise.compensated_diff(first, last)
+        modes = [noise.lighting_mode(resolve_frame(f)) for f in (files[0], files[-1])]
+    except:
+        return 999.0, True, "读图失败"
+    key = f"{name}.window"
+    model = noise.load_model(key)
+    changed, reason = noise.evaluate(model, modes[1], modes[0], diff, cam["threshold"])
+    noise.save_model(key, model)
+    return diff, changed, reason
+
+
 def compute_batch_diff(captures):
-    max_diff = 0.0
-    for cam in ["bedroom", "living", "door"]:
-        files = captures[cam]
-        if len(files) < 2:
-            continue
-        try:
-            first = Image.open(files[0]).convert("L").resize(CMP_SIZE)
-            last = Image.open(files[-1]).convert("L").resize(CMP_SIZE)
-            diff_img = ImageChops.difference(first, last)
-            pixels = list(diff_img.convert("L").tobytes())
-            diff = sum(pixels) / len(pixels)
-            max_diff = max(max_diff, diff)
-        except:
-            max_diff = 999.0
-    return max_diff
+    """并行计算每个摄像头的帧差，返回 {name: (diff, changed, 判定说明)}"""
+    pool = worker_pool()
+    futures = {name: pool.submit(camera_batch_diff, name, files)
+               for name, files in captures.items()}
+    return {name: fut.result() for name, fut in futures.items()}
 
 
 def sample_evenly(files, n):
@@ -127,12 +169,44 @@ def sample_evenly(files, n):
     return [files[int(i * step)] for i in range(n)]
 
 
-def resize_image(path):
-    img = Image.open(path)
-    if img.width > RESIZE_WIDTH:
-        ratio = RESIZE_WIDTH / img.width
+def select_keyframes(files, n, cam=None, changed=False):
+    """按相邻帧差挑关键帧：保留变化最大处前后的帧，去掉冗余帧
+
+    画面静止 → 只返回最新1张；活动越多 → 返回越多（最多 n 张）。
+    帧差和 L1 用同一信号（摄像头 ROI，开了噪声模型时去掉整体亮度偏移）。
+    changed = L1 判定窗口有变化：渐变时相邻帧差都不过阈值，也要带上最早一帧，让 Gemini 看到“之前”。
+    读图失败时退回 sample_evenly。
+    """
+    if len(files) <= 1:
+        return files
+    roi = cam.get("roi") if cam else None
+    try:
+        thumbs = [load_thumb(f, roi) for f in files]
+    except:
+        return sample_evenly(files, n)
+
+    # diffs[i] = 第 i 帧与第 i+1 帧之间的差异
+    diff = noise.compensated_diff if NOISE_ENABLED else thumb_diff
+    diffs = [diff(a, b) for a, b in zip(thumbs, thumbs[1:])]
+
+    keep = {len(files) - 1}  # 最新帧总是保留
+    for i in sorted(range(len(diffs)), key=lambda i: diffs[i], reverse=True):
+        if diffs[i] < KEYFRAME_DIFF_THRESHOLD or len(keep) >= n:
+            break
+        keep.add(i + 1)       # 变化后
+        if len(keep) < n:
+            keep.add(i)       # 变化前
+    if changed and len(keep) == 1 and n > 1:
+        keep.add(0)
+    return [files[i] for i in sorted(keep)]
+
+
+def resize_image(path, width=RESIZE_WIDTH):
+    img = Image.open(resolve_frame(path))
+    if img.width > width:
+        ratio = width / img.width
         new_h = int(img.height * ratio)
-        img = img.resize((RESIZE_WIDTH, new_h), Image.LANCZOS)
+        img = img.resize((width, new_h), Image.LANCZOS)
     buf = io.BytesIO()
     img.save(buf, format="JPEG", quality=85)
     return buf.getvalue()
@@ -149,20 +223,55 @@ def load_stats():
     return {"total_calls": 0, "total_skips": 0, "total_cost_usd": 0.0, "daily": {}}
 
 
-def update_stats(stats, called_gemini, num_images=0):
-    today = datetime.now().strftime("%Y-%m-%d")
+def estimate_cost(num_images, usage=None):
+    """按 usageMetadata 和模型价格表计费，缺失时按固定 token 估算"""
+    model = (usage or {}).get("model") or GEMINI_MODEL
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gemini-2.5-pro"])
+    if usage and usage.get("prompt_tokens"):
+        cached = usage.get("cached_tokens", 0)
+        fresh = usage["prompt_tokens"] - cached
+        return (fresh * input_price + cached * cached_price
+                + usage.get("output_tokens", 0) * output_price) / 1_000_000
+    input_tokens = num_images * IMG_TOKENS + PROMPT_TOKENS
+    return (input_tokens * input_price + OUTPUT_TOKENS * output_price) / 1_000_000
+
+
+def update_stats(stats, called_gemini, num_images=0, usage=None):
+    today = clock.now().strftime("%Y-%m-%d")
     if today not in stats["daily"]:
         stats["daily"][today] = {"calls": 0, "skips": 0, "images": 0, "cost_usd": 0.0}
     day = stats["daily"][today]
 
     if called_gemini:
-        input_tokens = num_images * IMG_TOKENS + PROMPT_TOKENS
-        cost = (input_tokens * INPUT_PRICE_PER_M + OUTPUT_TOKENS * OUTPUT_PRICE_PER_M) / 1_000_000
+        # 级联时 usage["tiers"] 是每一级的调用，分别计费并按模型累计
+        tiers = usage.get("tiers", [usage]) if usage else []
+        cost = sum(estimate_cost(num_images, u) for u in tiers) if tiers else estimate_cost(num_images)
+        for u in tiers:
+            tier = day.setdefault("tiers", {}).setdefault(
+                u.get("model") or GEMINI_MODEL, {"calls": 0, "latency_s": 0.0, "cost_usd": 0.0})
+            tier["calls"] += 1
+            tier["latency_s"] = round(tier["latency_s"] + u.get("latency_s", 0), 2)
+            tier["cost_usd"] = round(tier["cost_usd"] + estimate_cost(num_images, u), 6)
+        if usage and usage.get("escalated"):
+            day["escalations"] = day.get("escalations", 0) + 1
         stats["total_calls"] += 1
         stats["total_cost_usd"] = round(stats["total_cost_usd"] + cost, 6)
         day["calls"] += 1
         day["images"] = day.get("images", 0) + num_images
         day["cost_usd"] = round(day.get("cost_usd", 0) + cost, 6)
+
+        # 每次调用的 token / 延迟，用于对比指令缓存前后的效果
+        if usage:
+            for k in ("prompt_tokens", "cached_tokens", "output_tokens"):
+                day[k] = day.get(k, 0) + usage.get(k, 0)
+            day["latency_s"] = round(day.get("latency_s", 0) + usage.get("latency_s", 0), 2)
+            stats.setdefault("recent_calls", []).append({
+                "time": clock.now().strftime("%Y-%m-%d %H:%M"),
+                "images": num_images,
+                "cost_usd": round(cost, 6),
+                **usage,
+            })
+            stats["recent_calls"] = stats["recent_calls"][-RECENT_CALLS_KEEP:]
     else:
         stats["total_skips"] += 1
         day["skips"] += 1
@@ -173,13 +282,47 @@ def update_stats(stats, called_gemini, num_images=0):
 
 # ── Gemini 调用 ──
 
-def call_gemini(selected, gemini_key):
+def cascade_reason(text, baby_state):
+    """快速模型的结果需要升级到主模型的原因，可以直接采用时返回 None
+
+    升级条件：解析为 unknown、置信度不够高、或者按这个结果转换状态会触发（非普通级别的）告警
+    """
+    parsed = parse_gemini_result(text.strip().split("\n")[0].strip())
+    if parsed["status"] == "unknown":
+        return "状态不明"
+    if (parsed.get("confidence") or "") not in CASCADE_ACCEPT_CONFIDENCE:
+        return f"置信度{parsed.get('confidence') or '缺失'}"
+    trial, transitions = update_state(copy.deepcopy(baby_state), parsed)
+    if transitions:
+        baseline = evaluate_alerts(trial, [])
+        raised = [a for a in evaluate_alerts(trial, transitions)
+                  if a not in baseline and a["level"] != NORMAL]
+        if raised:
+            return f"转换会告警（{transitions[0]['from']}→{transitions[0]['to']}）"
+    return None
+
+
+def merge_usage(tiers, escalated):
+    """多级调用的用量合并：token / 延迟求和，model 记最终采用的那一级"""
+    merged = {"model": tiers[-1]["model"], "escalated": escalated, "tiers": tiers,
+              "latency_s": round(sum(u.get("latency_s", 0) for u in tiers), 2)}
+    for k in ("prompt_tokens", "cached_tokens", "output_tokens"):
+        merged[k] = sum(u.get(k, 0) for u in tiers)
+    return merged
+
+
+def build_parts(frames, history, baby_state, width=RESIZE_WIDTH):
+    """组装请求内容：图片（带文件名标签）+ 最近记录 + 当前状态；静态 PROMPT 另走指令
+
+    frames: [(图片路径, 给 Gemini 看的文件名)]。实时分析和 batch.py 重标共用。
+    返回 (parts, total_size)
+    """
     parts = []
     total_size = 0
-    for f in selected:
-        img_bytes = resize_image(f)
+    for f, label in frames:
+        img_bytes = resize_image(f, width)
         total_size += len(img_bytes)
-        parts.append({"text": f"[{f.name}]"})
+        parts.append({"text": f"[{label}]"})
         parts.append({
             "inline_data": {
                 "mime_type": "image/jpeg",
@@ -187,29 +330,52 @@ def call_gemini(selected, gemini_key):
             }
         })
 
-    history = get_recent_logs()
     context = f"\n\n最近记录：\n{history}" if history else ""
+    status_ctx = f"\n当前状态: {baby_state['status']}（在{baby_state.get('room', '未知')}）"
+    parts.append({"text": (context + status_ctx).strip()})
+    return parts, total_size
+
 
+def call_gemini(selected, gemini_key, width=RESIZE_WIDTH):
+    """静态 PROMPT 走指令缓存，每次只发图片 + 最近记录 + 当前状态
+
+    GEMINI_CASCADE 打开时先问 GEMINI_FAST_MODEL，不够把握再问 GEMINI_MODEL（见 cascade_reason）。
+    width 是图片缩放宽度（预算调节会调小）。返回 (result, total_size, usage)
+    """
     baby_state = load_baby_state()
-    status_ctx = f"\n当前状态: {baby_state['status']}（在{baby_state.get('room', '未知')}）"
+    parts, total_size = build_parts([(f, frame_label(f)) for f in selected], get_recent_logs(),
+                                    baby_state, width)
 
-    parts.append({"text": PROMPT + context + status_ctx})
+    def ask(model):
+        return generate(model, parts, gemini_key, system=PROMPT, timeout=120,
+                        max_retry=GEMINI_MAX_RETRY, backoff=GEMINI_RETRY_BACKOFF)
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={gemini_key}"
-    payload = {"contents": [{"parts": parts}]}
+    if not GEMINI_CASCADE or GEMINI_FAST_MODEL == GEMINI_MODEL:
+        result, usage = ask(GEMINI_MODEL)
+        return result, total_size, usage
 
-    last_err = None
-    for i in range(GEMINI_MAX_RETRY):
+    tiers = []
+    try:
+        result, usage = ask(GEMINI_FAST_MODEL)
+        tiers.append(usage)
+        escalated = cascade_reason(result, baby_state)
+    except RateLimited:
+        raise
+    except Exception as e:
+        escalated = f"快速模型失败: {e}"
+    if escalated:
+        print(f"⤴️ {GEMINI_FAST_MODEL} → {GEMINI_MODEL}：{escalated}")
         try:
-            r = requests.post(url, json=payload, timeout=120)
-            r.raise_for_status()
-            result = r.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
-            return result, total_size
-        except Exception as e:
-            last_err = e
-            if i < GEMINI_MAX_RETRY - 1:
-                time.sleep(GEMINI_RETRY_BACKOFF[min(i, len(GEMINI_RETRY_BACKOFF) - 1)])
-    raise last_err
+            result, usage = ask(GEMINI_MODEL)
+            tiers.append(usage)
+        except RateLimited as e:
+            if not tiers:
+                raise
+            print(f"⏸️ {e}，采用 {GEMINI_FAST_MODEL} 结果")
+            escalated = None
+    else:
+        print(f"⚡ 采用 {GEMINI_FAST_MODEL} 结果")
+    return result, total_size, merge_usage(tiers, escalated)
 
 
 def handle_event(event, state, now):
@@ -219,7 +385,7 @@ def handle_event(event, state, now):
 
     last_event = state.get("last_event")
     last_event_time = state.get("last_event_time", 0)
-    minutes_since = (time.time() - last_event_time) / 60
+    minutes_since = (clock.time() - last_event_time) / 60
 
     if event == last_event and minutes_since < EVENT_DEDUP_MIN:
         print(f"⏭️ 事件「{event}」30分钟内已通知，跳过")
@@ -229,16 +395,47 @@ def handle_event(event, state, now):
     msg = f"{emoji} 锐锐{event}！猫眼检测到婴儿车"
 
     state["last_event"] = event
-    state["last_event_time"] = time.time()
+    state["last_event_time"] = clock.time()
 
     return True, msg
 
 
+def archive_safely(files, tier):
+    """归档失败不影响分析主流程"""
+    if not FRAME_ARCHIVE_ENABLED or not files:
+        return
+    try:
+        archive.archive_frames(files, tier)
+    except Exception as e:
+        print(f"⚠️ 归档失败: {e}")
+
+
+def override_light(summary, parsed, ha_states):
+    """开关灯以 HA 的灯为准：改写解析结果和日志行的第4栏，返回新的 summary
+
+    HA 只知道开灯/关灯，Gemini 看出的夜视（红外黑白画面）保留
+    """
+    light = ha.room_light(parsed.get("room") or "", ha_states) if ha_states else None
+    if not light:
+        return summary
+    if "夜视" in (parsed.get("light") or ""):
+        light = f"{light}、夜视"
+    parsed["light"] = light
+    parts = summary.split("|")
+    parts[3] = f" {light} " if len(parts) > 4 else f" {light}"
+    return "|".join(parts)
+
+
 # ── 主流程 ──
 
-def run_analyze():
+def run_analyze(gemini_fn=None, door_fn=None):
+    """gemini_fn / door_fn 可替换主分析和猫眼检查（replay.py 用录制结果回放）"""
+    gemini_fn = gemini_fn or call_gemini
+    door_fn = door_fn or check_door_event
+    # 只有正式猫眼检查才并行预取（回放注入的 door_fn 不访问网络）
+    prefetch_door = door_fn is check_door_event and bool(cameras("door"))
     gemini_key = open(GEMINI_KEY_PATH).read().strip()
-    now = datetime.now()
+    now = clock.now()
     tracker_state = load_tracker_state()
     stats = load_stats()
 
@@ -248,14 +445,47 @@ def run_analyze():
         print("没有截图可分析")
         return
 
-    # L1: 帧差检测
-    batch_diff = compute_batch_diff(captures)
+    # L1: 帧差检测（噪声模型 / 每个摄像头自己的阈值）
+    checks = compute_batch_diff(captures)
+    diffs = {name: c[0] for name, c in checks.items()}
+    changed_cams = [name for name, c in checks.items() if c[1]]
+    batch_diff = max(diffs.values(), default=0.0)
     last_gemini = tracker_state.get("last_gemini_time", 0)
-    minutes_since = (time.time() - last_gemini) / 60
-    significant_change = batch_diff > DIFF_THRESHOLD
-    force_check = minutes_since >= FORCE_ANALYZE_MIN
+    minutes_since = (clock.time() - last_gemini) / 60
+    significant_change = bool(changed_cams)
 
-    print(f"📊 帧差={batch_diff:.1f} (阈值{DIFF_THRESHOLD}) | 距上次={minutes_since:.0f}min")
+    # 预算调节：按今日花费和最近延迟决定强制间隔、采样张数、分辨率
+    if GOVERNOR_ENABLED and GOVERNOR_DAILY_BUDGET_USD > 0:
+        plan = governor.decide(stats)
+    else:
+        plan = {"quota": {name: cam["quota"] for name, cam in cameras("indoor")},
+                "width": RESIZE_WIDTH, "force_min": FORCE_ANALYZE_MIN}
+    force_check = minutes_since >= plan["force_min"]
+
+    # Home Assistant：上次分析后开过门 → 立即分析；全屋关灯、没动静 → 画面没变就不做定期强制分析
+    ha_states = ha.snapshot()
+    door_change = ha.last_door_open(ha_states) if ha_states else 0
+    door_trigger = door_change > max(last_gemini, tracker_state.get("last_door_trigger", 0))
+    if door_trigger:
+        # 先记下这次变化已触发过分析：分析失败也不会每分钟因为同一次开门再调一次
+        tracker_state["last_door_trigger"] = door_change
+        save_tracker_state(tracker_state)
+    if (force_check and not significant_change and not door_trigger and ha_states
+            and ha.quiet_dark(ha_states) and not governor.exempt_reason(load_baby_state())):
+        print("🌙 HA：全屋关灯、无动静，跳过定期强制分析")
+        force_check = False
+    force_check = force_check or door_trigger
+
+    # 有待确认的状态切换：下一轮就再看一次，别等到定期强制分析
+    pending = load_baby_state().get("pending")
+    force_check = force_check or bool(pending)
+    # 上次因 Gemini 限速顺延
+    deferred = tracker_state.get("analyze_deferred", False)
+    force_check = force_check or deferred
+
+    diff_desc = " ".join(f"{name}={d:.1f}" + (f"({r})" if r else "")
+                         for name, (d, _, r) in checks.items() if captures[name])
+    print(f"📊 帧差 {diff_desc} | 距上次={minutes_since:.0f}min")
 
     if not significant_change and not force_check:
         # L1: 无变化 — 跳过 Gemini，但检查持续状态告警
@@ -267,6 +497,12 @@ def run_analyze():
         last_desc = baby_state["status"]
         print(f"⚪ 无变化，延续 {last_desc}")
 
+        # 每个静止段归档一张关键帧
+        if not tracker_state.get("static_archived"):
+            archive_safely([files[-1] for _, files in captures.items() if files], "static")
+            tracker_state["static_archived"] = True
+            save_tracker_state(tracker_state)
+
         log_file = get_log_file()
         log_file.parent.mkdir(exist_ok=True)
         with open(log_file, "a") as f:
@@ -276,25 +512,45 @@ def run_analyze():
         return
 
     # L2: Gemini 分析
-    reason = "画面变化" if significant_change else "定期强制"
+    reason = ("画面变化" if significant_change else "HA 开门" if door_trigger
+              else f"确认{pending['status']}" if pending else "限速顺延" if deferred else "定期强制")
     print(f"🔴 触发分析（{reason}）")
+    if significant_change:
+        tracker_state["static_archived"] = False
 
-    bedroom_sampled = sample_evenly(captures["bedroom"], MAX_PER_CAM)
-    living_sampled = sample_evenly(captures["living"], MAX_PER_CAM)
-    selected = bedroom_sampled + living_sampled
-    print(f"📷 采样{len(selected)}张（卧室{len(bedroom_sampled)} + 客厅{len(living_sampled)}）")
+    indoor = cameras("indoor")
+    sampled = list(worker_pool().map(
+        lambda item: select_keyframes(captures[item[0]], plan["quota"][item[0]], item[1],
+                                      item[0] in changed_cams), indoor))
+    selected = [f for files in sampled for f in files]
+    sample_desc = " + ".join(f"{cam['label']}{len(files)}" for (_, cam), files in zip(indoor, sampled))
+    print(f"📷 采样{len(selected)}张（{sample_desc}）")
+
+    # 猫眼告警预取：和主分析并行拉取，转换确实需要时再判断婴儿车
+    door_future = worker_pool().submit(fetch_door_alarms) if prefetch_door else None
+
+    def check_door(direction):
+        if door_future:
+            return door_fn(direction, gemini_key, prefetch=door_future)
+        return door_fn(direction, gemini_key)
 
     try:
-        result_text, total_size = call_gemini(selected, gemini_key)
+        result_text, total_size, usage = gemini_fn(selected, gemini_key, width=plan["width"])
         print(f"📦 {total_size // 1024}KB → 🤖 {result_text}")
+        print(f"⏱️ {usage['latency_s']}s | tokens 输入{usage['prompt_tokens']}"
+              f"（缓存{usage['cached_tokens']}）输出{usage['output_tokens']}")
 
         # 更新状态机
         summary = result_text.strip().split("\n")[0].strip()
         parsed = parse_gemini_result(summary)
+        summary = override_light(summary, parsed, ha_states)
         baby_state = load_baby_state()
         old_status = baby_state["status"]
         baby_state, transitions = update_state(baby_state, parsed)
         new_status = baby_state["status"]
+        if baby_state.get("pending"):
+            p = baby_state["pending"]
+            print(f"⏳ 待确认 {old_status}→{p['status']}（证据{p['weight']}/{STATE_CONFIRM_WEIGHT}）")
         save_baby_state(baby_state)
 
         # 评估告警（状态转换类）
@@ -310,13 +566,13 @@ def run_analyze():
         if was_visible and not ruirui_visible:
             # 锐锐消失了 → 可能出门
             print("👀 锐锐从室内消失，检查猫眼...")
-            has_stroller, _ = check_door_event("out", gemini_key)
+            has_stroller, _ = check_door("out")
             if has_stroller:
                 event = "出门"
         elif not was_visible and ruirui_visible:
             # 锐锐出现了 → 可能回来
             print("👀 锐锐重新出现，检查猫眼...")
-            has_stroller, _ = check_door_event("in", gemini_key)
+            has_stroller, _ = check_door("in")
             if has_stroller:
                 event = "回来"
 
@@ -341,22 +597,45 @@ def run_analyze():
         with open(log_file, "a") as f:
             f.write(entry)
 
+        # 归档：送分析的帧；有状态转换时整个窗口都留
+        archive_safely(selected, "analyzed")
+        if transitions or event:
+            archive_safely([f for files in captures.values() for f in files], "transition")
+        if FRAME_ARCHIVE_ENABLED:
+            try:
+                archive.prune()
+            except Exception as e:
+                print(f"⚠️ 归档清理失败: {e}")
+
         # 更新 tracker state
-        tracker_state["last_gemini_time"] = time.time()
+        tracker_state["last_gemini_time"] = clock.time()
         tracker_state["last_result"] = result_text
+        tracker_state["analyze_deferred"] = False
         save_tracker_state(tracker_state)
 
-        stats, day = update_stats(stats, called_gemini=True, num_images=len(selected))
+        stats, day = update_stats(stats, called_gemini=True, num_images=len(selected), usage=usage)
         print(f"✅ 状态={baby_state['status']} | 📈 今日{day['calls']}次 ${day['cost_usd']:.4f}")
 
+    except RateLimited as e:
+        # 没花钱：不算 unknown，下一分钟再试（scheduler 看 analyze_deferred）
+        print(f"⏸️ {e}，本轮分析顺延")
+        tracker_state["analyze_deferred"] = True
+        save_tracker_state(tracker_state)
+        update_stats(stats, called_gemini=False)
     except Exception as e:
         print(f"❌ 分析失败: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(e.response.text[:500])
+        if deferred:
+            tracker_state["analyze_deferred"] = False  # 真失败不再每分钟重试
+            save_tracker_state(tracker_state)
         baby_state = load_baby_state()
         baby_state["consecutive_unknown"] = baby_state.get("consecutive_unknown", 0) + 1
         save_baby_state(baby_state)
         update_stats(stats, called_gemini=False)
+    finally:
+        if door_future:
+            door_future.cancel()  # 还没开始就不用拉了
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""关键帧归档：分级保留 + 内容寻址 + 感知哈希去重
+
+CAPTURE_DIR 里的截图30分钟后就删；值得留的帧在删之前拷进归档：
+- analyzed:   送进 Gemini 分析的帧
+- transition: 状态转换前后窗口内的帧
+- static:     长时间无变化时，每个静止段留一张
+
+对象按 sha256 存放（objects/ab/abcd….jpg），同一摄像头和最近的帧 dHash 汉明距离
+≤ FRAME_ARCHIVE_DUP_DIST 且平均亮度相近时视为近似重复，直接引用已有对象不再存一份。
+每级有各自的保留天数，总量超过配额时按 static → analyzed → transition、从旧到新淘汰。
+
+用法: python archive.py [stats|prune]
+"""
+
+import sys, hashlib, sqlite3
+from PIL import Image
+
+from config import *
+import clock
+from capture import resolve_frame
+
+# 淘汰顺序：数字越小越先淘汰；同一帧按更高的级别保留
+TIER_RANK = {"static": 0, "analyzed": 1, "transition": 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    sha TEXT PRIMARY KEY,
+    cam TEXT NOT NULL,
+    phash TEXT NOT NULL,
+    luma INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    cam TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ts REAL NOT NULL,
+    tier TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    UNIQUE (cam, name, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_frames_ts ON frames(cam, ts);
+CREATE INDEX IF NOT EXISTS idx_frames_sha ON frames(sha);
+CREATE INDEX IF NOT EXISTS idx_objects_cam ON objects(cam, ts);
+"""
+
+
+def connect():
+    FRAME_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(FRAME_ARCHIVE_DIR / "index.sqlite", timeout=30)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def object_path(sha):
+    return FRAME_ARCHIVE_DIR / "objects" / sha[:2] / f"{sha}.jpg"
+
+
+def dhash(img, size=8):
+    """64 位差异哈希（十六进制）：相邻像素亮度比较，对压缩噪声/轻微曝光变化不敏感"""
+    gray = img.convert("L").resize((size + 1, size))
+    px = gray.tobytes()
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return f"{bits:016x}"
+
+
+def mean_luma(img):
+    """平均亮度：dHash 只看相对明暗，开关灯这种整体变化要靠它区分"""
+    px = img.convert("L").resize((16, 16)).tobytes()
+    return sum(px) // len(px)
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def camera_of(path):
+    return path.stem.rsplit("_", 1)[0]
+
+
+def find_near_duplicate(db, cam, phash, luma):
+    """同一摄像头最近的对象里找近似重复（结构相近且亮度相近）"""
+    rows = db.execute("SELECT sha, phash, luma FROM objects WHERE cam = ? ORDER BY ts DESC LIMIT ?",
+                      (cam, FRAME_ARCHIVE_DUP_WINDOW)).fetchall()
+    for r in rows:
+        if (hamming(r["phash"], phash) <= FRAME_ARCHIVE_DUP_DIST
+                and abs(r["luma"] - luma) <= FRAME_ARCHIVE_DUP_LUMA):
+            return r["sha"]
+    return None
+
+
+def archive_frames(files, tier):
+    """把一批截图归档到指定级别，返回 (新存对象数, 去重复用数)"""
+    db = connect()
+    stored = reused = 0
+    try:
+        for f in files:
+            try:
+                cam, ts = camera_of(f), f.stat().st_mtime
+                existing = db.execute("SELECT id, tier FROM frames WHERE cam = ? AND name = ? AND ts = ?",
+                                      (cam, f.name, ts)).fetchone()
+                if existing:
+                    if TIER_RANK[tier] > TIER_RANK[existing["tier"]]:
+                        db.execute("UPDATE frames SET tier = ? WHERE id = ?", (tier, existing["id"]))
+                    continue
+
+                src = resolve_frame(f)
+                data = src.read_bytes()
+                sha = hashlib.sha256(data).hexdigest()
+                if not db.execute("SELECT 1 FROM objects WHERE sha = ?", (sha,)).fetchone():
+                    img = Image.open(src)
+                    phash, luma = dhash(img), mean_luma(img)
+                    dup = find_near_duplicate(db, cam, phash, luma)
+                    if dup:
+                        sha = dup
+                        reused += 1
+                    else:
+                        path = object_path(sha)
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        path.write_bytes(data)
+                        db.execute("INSERT INTO objects (sha, cam, phash, luma, size, ts)"
+                                   " VALUES (?,?,?,?,?,?)", (sha, cam, phash, luma, len(data), ts))
+                        stored += 1
+                else:
+                    reused += 1
+                db.execute("INSERT INTO frames (cam, name, ts, tier, sha) VALUES (?,?,?,?,?)",
+                           (cam, f.name, ts, tier, sha))
+            except Exception as e:
+                print(f"  ⚠️ 归档失败 {f.name}: {e}")
+        db.commit()
+    finally:
+        db.close()
+    if stored or reused:
+        print(f"🗄️ 归档[{tier}] 新存{stored}张，去重复用{reused}张")
+    return stored, reused
+
+
+def _drop_orphans(db):
+    """删掉没有帧引用的对象，返回释放字节数"""
+    freed = 0
+    rows = db.execute("SELECT sha, size FROM objects WHERE sha NOT IN (SELECT DISTINCT sha FROM frames)").fetchall()
+    for r in rows:
+        object_path(r["sha"]).unlink(missing_ok=True)
+        db.execute("DELETE FROM objects WHERE sha = ?", (r["sha"],))
+        freed += r["size"]
+    return freed
+
+
+def total_size(db):
+    return db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+
+def prune():
+    """按级别保留天数过期，再按配额淘汰，返回释放字节数"""
+    db = connect()
+    try:
+        now = clock.time()
+        for tier, days in FRAME_ARCHIVE_RETENTION_DAYS.items():
+            db.execute("DELETE FROM frames WHERE tier = ? AND ts < ?", (tier, now - days * 86400))
+        freed = _drop_orphans(db)
+
+        quota = FRAME_ARCHIVE_QUOTA_MB * 1024 * 1024
+        if total_size(db) > quota:
+            order = sorted(TIER_RANK, key=TIER_RANK.get)
+            for tier in order:
+                while total_size(db) > quota:
+                    ids = [r["id"] for r in db.execute(
+                        "SELECT id FROM frames WHERE tier = ? ORDER BY ts LIMIT 100", (tier,))]
+                    if not ids:
+                        break
+                    db.executemany("DELETE FROM frames WHERE id = ?", [(i,) for i in ids])
+                    freed += _drop_orphans(db)
+        db.commit()
+    finally:
+        db.close()
+    if freed:
+        print(f"🧹 归档清理释放 {freed // 1024}KB")
+    return freed
+
+
+def list_frames(cam=None, start=None, end=None, tier=None):
+    """按条件列出归档帧：[{cam, name, ts, tier, path}]，按时间排序"""
+    where, params = ["1 = 1"], []
+    if cam:
+        where.append("cam = ?"); params.append(cam)
+    if start is not None:
+        where.append("ts >= ?"); params.append(start)
+    if end is not None:
+        where.append("ts < ?"); params.append(end)
+    if tier:
+        where.append("tier = ?"); params.append(tier)
+    db = connect()
+    try:
+        rows = db.execute(f"SELECT cam, name, ts, tier, sha FROM frames WHERE {' AND '.join(where)}"
+                          " ORDER BY ts", params).fetchall()
+    finally:
+        db.close()
+    return [{"cam": r["cam"], "name": r["name"], "ts": r["ts"], "tier": r["tier"],
+             "path": object_path(r["sha"])} for r in rows]
+
+
+def print_stats():
+    db = connect()
+    try:
+        for r in db.execute("SELECT tier, count(*) AS n, count(DISTINCT sha) AS objs FROM frames GROUP BY tier"):
+            print(f"{r['tier']:<11} 帧{r['n']:6d}  对象{r['objs']:6d}")
+        used = total_size(db)
+        print(f"占用 {used / 1024 / 1024:.1f}MB / 配额 {FRAME_ARCHIVE_QUOTA_MB}MB")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "prune":
+        prune()
+    print_stats()
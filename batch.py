@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""批量重标：改了 prompt / 解析规则后，用归档帧把过去的时段重新分析一遍
+
+- 从 archive 按分析周期切出窗口，每个摄像头按配额挑关键帧，组装和 call_gemini 一样的请求
+  （上下文用原日志里当时的最近记录和状态）
+- 通过 batchGenerateContent 批量提交（异步、半价），同时最多 BATCH_MAX_INFLIGHT 个任务
+- 每一步写断点文件，中断后用同一个 --tag 重跑会接着轮询已提交的任务、只补没完成的窗口
+- 结果按时间顺序过一遍状态机，写成和正式日志同格式的 BATCH_DIR/ruirui_YYYY-MM-DD.md，
+  并和原日志逐条对比（正式日志不动）
+
+用法:
+    batch.py run --from 2026-10-01 [--to 2026-10-07] [--tag v2-prompt] [--model gemini-2.5-pro]
+    batch.py status --tag v2-prompt
+    batch.py stub [8771]     # 本地批量接口替身，配合 GEMINI_API_BASE=http://127.0.0.1:8771
+"""
+
+import sys, json, time, copy, argparse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from config import *
+import archive
+import analytics
+import clock
+from analyze import PROMPT, build_parts, select_keyframes
+from capture import frame_label
+from gemini import build_payload, batch_submit, batch_get
+from state import DEFAULT_STATE, parse_gemini_result, update_state
+
+BATCH_MAX_ATTEMPTS = 2  # 任务失败时窗口最多提交几次
+
+
+# ── 窗口 ──
+
+def day_context(day):
+    """原日志：[(分钟, 原始行, 解析记录)]，用来给窗口补“最近记录/当前状态”上下文"""
+    path = analytics.day_log_path(day)
+    if not path.exists():
+        return []
+    entries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        rec = analytics.parse_line(line)
+        if rec and "time" in rec:
+            entries.append((rec["minute"], line, rec))
+    return entries
+
+
+def collect_windows(start_day, end_day):
+    """归档帧按 ANALYZE_EVERY_MIN 切窗口，返回 {窗口id: {day, time, ts, frames, history, status, room}}"""
+    start = datetime.strptime(start_day, "%Y-%m-%d")
+    end = datetime.strptime(end_day, "%Y-%m-%d") + timedelta(days=1)
+    indoor = cameras("indoor")
+    period = ANALYZE_EVERY_MIN * 60
+
+    buckets = {}
+    for row in archive.list_frames(start=start.timestamp(), end=end.timestamp()):
+        if row["cam"] in CAMERAS and CAMERAS[row["cam"]]["role"] == "indoor":
+            buckets.setdefault(int(row["ts"] // period), {}).setdefault(row["cam"], []).append(row)
+
+    contexts = {}
+    windows = {}
+    for slot in sorted(buckets):
+        # 窗口结束时刻 = 当时实时分析的时刻
+        at = datetime.fromtimestamp((slot + 1) * period)
+        day, minute = at.strftime("%Y-%m-%d"), at.hour * 60 + at.minute
+        frames = []
+        for name, cam in indoor:
+            rows = sorted(buckets[slot].get(name, []), key=lambda r: r["ts"])
+            paths = [Path(r["path"]) for r in rows]
+            labels = {id(p): frame_label(r["name"]) for p, r in zip(paths, rows)}
+            frames += [(str(p), labels[id(p)]) for p in select_keyframes(paths, cam["quota"], cam)]
+        if not frames:
+            continue
+
+        if day not in contexts:
+            contexts[day] = day_context(day)
+        before = [e for e in contexts[day] if e[0] < minute]
+        last = next((e[2] for e in reversed(before) if e[2]["kind"] == "analyze"), {})
+        windows[at.strftime("%Y-%m-%d %H:%M")] = {
+            "day": day, "time": at.strftime("%H:%M"), "ts": at.timestamp(), "frames": frames,
+            "history": "\n".join(e[1] for e in before[-6:]),
+            "status": before[-1][2]["status"] if before else "unknown",
+            "room": last.get("room") or "未知",
+        }
+    return windows
+
+
+def build_request(window, width):
+    parts, _ = build_parts(window["frames"], window["history"],
+                           {"status": window["status"], "room": window["room"]}, width)
+    return build_payload(parts, PROMPT)
+
+
+# ── 断点 ──
+
+def checkpoint_path(tag):
+    return BATCH_DIR / f"{tag}.checkpoint.json"
+
+
+def load_checkpoint(tag):
+    try:
+        return json.loads(checkpoint_path(tag).read_text())
+    except:
+        return None
+
+
+def save_checkpoint(ckpt):
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_path(ckpt["tag"])
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(ckpt, ensure_ascii=False))
+    tmp.replace(path)
+
+
+def pending_windows(ckpt):
+    submitted = {wid for ids in ckpt["jobs"].values() for wid in ids}
+    return [wid for wid in sorted(ckpt["windows"])
+            if wid not in ckpt["results"] and wid not in submitted]
+
+
+# ── 提交 / 轮询 ──
+
+def submit_next(ckpt, key, width):
+    pending = pending_windows(ckpt)[:BATCH_WINDOWS_PER_JOB]
+    items = [(wid, build_request(ckpt["windows"][wid], width)) for wid in pending]
+    name = batch_submit(ckpt["model"], items, key, f"ruirui-{ckpt['tag']}-{pending[0]}")
+    ckpt["jobs"][name] = pending
+    for wid in pending:
+        ckpt["attempts"][wid] = ckpt["attempts"].get(wid, 0) + 1
+    save_checkpoint(ckpt)
+    print(f"📤 {name}: {len(pending)}个窗口 {pending[0]} ~ {pending[-1]}")
+
+
+def poll_jobs(ckpt, key):
+    for name, ids in list(ckpt["jobs"].items()):
+        try:
+            state, results = batch_get(name, key, ckpt["model"])
+        except Exception as e:
+            print(f"⚠️ {name}: 查询失败 {e}")
+            continue
+        if results is None:
+            print(f"⏳ {name}: {state}")
+            continue
+        done = 0
+        for wid in ids:
+            text, usage = results.get(wid, (None, f"任务{state}，无结果"))
+            if text is not None:
+                ckpt["results"][wid] = {"text": text, "usage": usage}
+                done += 1
+            elif ckpt["attempts"].get(wid, 0) >= BATCH_MAX_ATTEMPTS:
+                ckpt["results"][wid] = {"error": usage}
+        del ckpt["jobs"][name]
+        save_checkpoint(ckpt)
+        print(f"📥 {name}: {state} 成功{done}/{len(ids)}")
+
+
+def run(args, key):
+    tag = args.tag or f"{args.start}_{args.end or args.start}"
+    ckpt = load_checkpoint(tag)
+    if ckpt:
+        print(f"↩️ 续跑 {tag}：已完成{len(ckpt['results'])}/{len(ckpt['windows'])}，在跑任务{len(ckpt['jobs'])}个")
+    else:
+        windows = collect_windows(args.start, args.end or args.start)
+        if not windows:
+            print("归档里没有这个时段的帧")
+            return
+        ckpt = {"tag": tag, "model": args.model, "windows": windows,
+                "jobs": {}, "results": {}, "attempts": {}}
+        save_checkpoint(ckpt)
+        print(f"🗂️ {tag}：{len(windows)}个窗口，{sum(len(w['frames']) for w in windows.values())}张图")
+
+    t0 = time.time()
+    while pending_windows(ckpt) or ckpt["jobs"]:
+        while pending_windows(ckpt) and len(ckpt["jobs"]) < BATCH_MAX_INFLIGHT:
+            submit_next(ckpt, key, args.width)
+        time.sleep(args.poll)
+        poll_jobs(ckpt, key)
+    print(f"✅ 全部完成，用时{time.time() - t0:.0f}s")
+    reconcile(ckpt)
+
+
+# ── 对账 ──
+
+def reconcile(ckpt):
+    """按时间顺序过状态机，写重标日志，和原日志对比"""
+    by_day = {}
+    for wid in sorted(ckpt["results"]):
+        by_day.setdefault(ckpt["windows"][wid]["day"], []).append(wid)
+
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    tokens = errors = 0
+    for day, wids in by_day.items():
+        original = {e[2]["time"]: e[2] for e in day_context(day) if e[2]["kind"] == "analyze"}
+        baby = copy.deepcopy(DEFAULT_STATE)
+        lines, diffs = [], []
+        for wid in wids:
+            w, res = ckpt["windows"][wid], ckpt["results"][wid]
+            if "error" in res:
+                errors += 1
+                continue
+            tokens += res["usage"].get("prompt_tokens", 0) + res["usage"].get("output_tokens", 0)
+            summary = res["text"].strip().split("\n")[0].strip()
+            clock.set_time(w["ts"])
+            baby, _ = update_state(baby, parse_gemini_result(summary))
+            lines.append(f"- {w['time']} [{baby['status']}] | {summary}\n")
+            old = original.get(w["time"])
+            if old and old["status"] != baby["status"]:
+                diffs.append(f"  {w['time']} {old['status']} → {baby['status']}")
+        clock.reset()
+        (BATCH_DIR / f"ruirui_{day}.md").write_text("".join(lines), encoding="utf-8")
+        print(f"📝 {day}: 重标{len(lines)}条，与原日志状态不同{len(diffs)}条 → {BATCH_DIR / f'ruirui_{day}.md'}")
+        for d in diffs[:20]:
+            print(d)
+    print(f"📊 tokens {tokens}，失败窗口{errors}个")
+
+
+def status(tag):
+    ckpt = load_checkpoint(tag)
+    if not ckpt:
+        print(f"没有断点 {tag}")
+        return
+    errors = sum(1 for r in ckpt["results"].values() if "error" in r)
+    print(f"{tag}: 窗口{len(ckpt['windows'])} 完成{len(ckpt['results']) - errors} 失败{errors} "
+          f"待提交{len(pending_windows(ckpt))} 在跑任务{list(ckpt['jobs'])}")
+
+
+# ── 本地替身 ──
+
+def run_stub(port=8771):
+    """最小批量接口替身：提交后第一次查询返回 RUNNING，之后 SUCCEEDED（每个请求回一行固定格式结果）"""
+    jobs = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if ":batchGenerateContent" not in self.path:
+                return self.reply(404, {"error": "not found"})
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            name = f"batches/stub{len(jobs) + 1}"
+            jobs[name] = {"requests": body["batch"]["input_config"]["requests"]["requests"], "polls": 0}
+            self.reply(200, {"name": name, "metadata": {"state": "BATCH_STATE_PENDING"}})
+
+        def do_GET(self):
+            name = self.path.split("?")[0].lstrip("/")
+            job = jobs.get(name)
+            if not job:
+                return self.reply(404, {"error": "not found"})
+            job["polls"] += 1
+            if job["polls"] < 2:
+                return self.reply(200, {"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}})
+            responses = []
+            for req in job["requests"]:
+                images = sum(1 for p in req["request"]["contents"][0]["parts"] if "inline_data" in p)
+                text = ("客厅 | 坐在地垫上玩玩具 | 妈妈 | 明亮 | 高" if images > 2
+                        else "卧室 | 一直在婴儿床里睡觉 | 无人 | 夜视 | 高")
+                responses.append({"metadata": req["metadata"], "response": {
+                    "candidates": [{"content": {"parts": [{"text": text}]}}],
+                    "usageMetadata": {"promptTokenCount": 258 * images + 800, "candidatesTokenCount": 30},
+                }})
+            self.reply(200, {"name": name, "done": True,
+                             "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+                             "response": {"inlinedResponses": {"inlinedResponses": responses}}})
+
+    print(f"🧪 批量接口替身 http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def main():
+    p = argparse.ArgumentParser(prog="batch.py", description="锐锐归档帧批量重标")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--from", dest="start", required=True, help="起始日期 YYYY-MM-DD")
+    r.add_argument("--to", dest="end", help="结束日期（含），默认同起始")
+    r.add_argument("--tag", help="断点名，默认 起始_结束")
+    r.add_argument("--model", default=GEMINI_MODEL)
+    r.add_argument("--width", type=int, default=RESIZE_WIDTH)
+    r.add_argument("--poll", type=float, default=BATCH_POLL_SEC, help="轮询间隔秒")
+    s = sub.add_parser("status")
+    s.add_argument("--tag", required=True)
+    st = sub.add_parser("stub")
+    st.add_argument("port", nargs="?", type=int, default=8771)
+    args = p.parse_args()
+
+    if args.cmd == "stub":
+        run_stub(args.port)
+    elif args.cmd == "status":
+        status(args.tag)
+    else:
+        run(args, open(GEMINI_KEY_PATH).read().strip())
+
+
+if __name__ == "__main__":
+    main()
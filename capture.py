@@ -1,11 +1,26 @@
 """采集层：多源抓帧 + 重试 + 帧差检测"""
 
-import time, io, json, requests
+import os, time, io, json, threading, requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from PIL import Image, ImageChops
 
 from config import *
+import clock
+import motion
+import noise
+
+# 进程内共用：go2rtc 连接复用；抓帧/帧差/采样的工作线程（tenants.py 多户共用同一进程时也只有这一份）
+SESSION = requests.Session()
+_pool = None
+
+
+def worker_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix="ruirui-worker")
+    return _pool
 
 
 def load_state():
@@ -18,20 +33,100 @@ def load_state():
 
 
 def save_state(state):
-    STATE_FILE.write_text(json.dumps(state, default=str))
+    # stream.py 和 capture 可能同时读写，先写临时文件再替换，读的一方不会读到半个文件
+    tmp = STATE_FILE.with_name(f"{STATE_FILE.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(state, default=str))
+    tmp.replace(STATE_FILE)
+
+
+def frame_keys(name):
+    """采集状态里每个摄像头的帧字段：stream 模式下由 stream.py 写，其他地方合并状态时不要覆盖"""
+    return (f"last_{name}", f"mode_{name}", f"prev_mode_{name}")
+
+
+def resolve_frame(path):
+    """截图路径 → 实际 JPEG 路径；.ref 是无变化帧的引用，指向上一张落盘的帧"""
+    path = Path(path)
+    if path.suffix == ".ref":
+        return Path(json.loads(path.read_text())["ref"])
+    return path
+
+
+def list_frames(pattern="*"):
+    """CAPTURE_DIR 里的截图和引用帧"""
+    return list(CAPTURE_DIR.glob(f"{pattern}.jpg")) + list(CAPTURE_DIR.glob(f"{pattern}.ref"))
+
+
+def frame_label(path):
+    """给 Gemini 看的文件名：引用帧也显示成 摄像头_时间.jpg"""
+    return f"{Path(path).stem}.jpg"
+
+
+def store_frame(name, img_bytes, now_str, diff, keep, last_path):
+    """落盘一帧，返回 (路径, 是否引用)
+
+    CAPTURE_DEDUP 打开且不需要保留整帧（keep=False，画面没变）时，只写一个小 .ref 文件
+    指向上一张落盘的帧（带时间和帧差），不再重复写整张 JPEG。
+    """
+    if CAPTURE_DEDUP and last_path and not keep:
+        ref_path = CAPTURE_DIR / f"{name}_{now_str}.ref"
+        ref_path.write_text(json.dumps({"ref": str(last_path), "ts": clock.time(), "diff": round(diff, 2)}))
+        return ref_path, True
+    output_path = CAPTURE_DIR / f"{name}_{now_str}.jpg"
+    output_path.write_bytes(img_bytes)
+    return output_path, False
 
 
-def frame_diff(img_bytes, last_path):
+def load_thumb(src, roi=None):
+    """读图 → 灰度 → 裁 ROI → 缩到 CMP_SIZE；src 可以是路径（含 .ref）或 JPEG bytes"""
+    img = Image.open(io.BytesIO(src) if isinstance(src, bytes) else resolve_frame(src))
+    # JPEG 直接按缩小比例解码（DCT 缩放），比解完整图再缩快数倍
+    scale = 1 / min(roi[2] - roi[0], roi[3] - roi[1]) if roi else 1
+    img.draft("L", (int(CMP_SIZE[0] * scale), int(CMP_SIZE[1] * scale)))
+    img = img.convert("L")
+    if roi:
+        x0, y0, x1, y1 = roi
+        img = img.crop((int(x0 * img.width), int(y0 * img.height),
+                        int(x1 * img.width), int(y1 * img.height)))
+    return img.resize(CMP_SIZE)
+
+
+def thumb_diff(a, b):
+    pixels = ImageChops.difference(a, b).tobytes()
+    return sum(pixels) / len(pixels)
+
+
+def frame_diff(img_bytes, last_path, roi=None):
     try:
-        curr = Image.open(io.BytesIO(img_bytes)).convert("L").resize(CMP_SIZE)
-        prev = Image.open(last_path).convert("L").resize(CMP_SIZE)
-        diff_img = ImageChops.difference(curr, prev)
-        pixels = list(diff_img.convert("L").tobytes())
-        return sum(pixels) / len(pixels)
+        return thumb_diff(load_thumb(img_bytes, roi), load_thumb(last_path, roi))
     except:
         return 999.0
 
 
+def detect_change(name, cam, prev_thumb, thumb, img_bytes, prev_mode, ts, ref_thumb=None, ref_mode=None):
+    """和上一次采集对比：写运动序列 + 判定变化；和引用目标（上一张落盘的整帧）对比决定是否落整帧
+
+    返回 {diff, changed, keep, mode, reason}；diff 是相邻两次采集的帧差（.ref 采集也算一次采集）。
+    keep = 需要落整帧：有变化，或画面相对引用目标漂移超过阈值、光照模式和引用目标不同
+    —— 否则 .ref 指向的帧已经不像当前画面。ref_thumb 不给表示上一次采集就是引用目标。
+    """
+    diff = motion.record(name, prev_thumb, thumb, ts)
+    if ref_thumb is None:
+        ref_thumb, ref_mode = prev_thumb, prev_mode
+    ref_diff = diff if ref_thumb is prev_thumb else thumb_diff(ref_thumb, thumb)
+    if not NOISE_ENABLED:
+        changed = diff > cam["threshold"]
+        return {"diff": diff, "changed": changed, "keep": changed or ref_diff > cam["threshold"],
+                "mode": None, "reason": ""}
+    mode = noise.lighting_mode(img_bytes)
+    model = noise.load_model(name)
+    changed, reason = noise.evaluate(model, mode, prev_mode, noise.compensated_diff(prev_thumb, thumb),
+                                     cam["threshold"])
+    noise.save_model(name, model)
+    keep = changed or ref_diff > cam["threshold"] or bool(ref_mode and mode != ref_mode)
+    return {"diff": diff, "changed": changed, "keep": keep, "mode": mode, "reason": reason}
+
+
 def retry_request(fn, max_retry=CAPTURE_MAX_RETRY, backoff=None):
     """通用重试包装"""
     backoff = backoff or CAPTURE_RETRY_BACKOFF
@@ -50,7 +145,7 @@ def retry_request(fn, max_retry=CAPTURE_MAX_RETRY, backoff=None):
 def capture_go2rtc(src):
     """从 go2rtc 抓帧"""
     def _fetch():
-        r = requests.get(f"{GO2RTC_URL}/api/frame.jpeg?src={src}", timeout=30)
+        r = SESSION.get(f"{GO2RTC_URL}/api/frame.jpeg?src={src}", timeout=30)
         r.raise_for_status()
         if len(r.content) < 1000:
             raise ValueError(f"image too small: {len(r.content)} bytes")
@@ -58,6 +153,37 @@ def capture_go2rtc(src):
     return retry_request(_fetch)
 
 
+def iter_jpeg_frames(chunks):
+    """增量解析 MJPEG 字节流：按 SOI/EOI 标记切出完整 JPEG，逐帧 yield"""
+    buf = b""
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            if start < 0:
+                buf = buf[-1:]  # 可能是被切开的标记前半
+                break
+            end = buf.find(b"\xff\xd9", start + 2)
+            if end < 0:
+                buf = buf[start:]
+                break
+            yield buf[start:end + 2]
+            buf = buf[end + 2:]
+
+
+def capture_mjpeg(url):
+    """从 MJPEG 流地址读出第一帧"""
+    def _fetch():
+        with requests.get(url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            for img in iter_jpeg_frames(r.iter_content(chunk_size=16384)):
+                if len(img) < 1000:
+                    raise ValueError(f"image too small: {len(img)} bytes")
+                return img
+        raise ValueError("stream ended before a full frame")
+    return retry_request(_fetch)
+
+
 def get_ys7_token(state):
     """获取或复用萤石云 token"""
     token = state.get("ys7_token")
@@ -97,73 +223,193 @@ def capture_ys7(serial, token):
 def check_go2rtc_health():
     """检查 go2rtc 是否在线"""
     try:
-        r = requests.get(f"{GO2RTC_URL}/api/streams", timeout=5)
+        r = SESSION.get(f"{GO2RTC_URL}/api/streams", timeout=5)
         return r.status_code == 200
     except:
         return False
 
 
+def fetch_frame(cam, go2rtc_ok, ys7_token):
+    """按 source 类型抓一帧"""
+    if cam["source"] == "go2rtc":
+        if not go2rtc_ok:
+            raise ConnectionError("go2rtc offline")
+        return capture_go2rtc(cam["src"])
+    if cam["source"] == "ys7":
+        return capture_ys7(cam["src"], ys7_token)
+    if cam["source"] == "mjpeg":
+        return capture_mjpeg(cam["src"])
+    raise ValueError(f"unknown source: {cam['source']}")
+
+
+def prev_thumb_path(name):
+    """上一次采集的缩略图（.ref 采集没有整帧，帧差要对比的是它而不是引用目标）"""
+    return CAPTURE_DIR / f"{name}_prev.png"
+
+
+def ingest_frame(name, cam, img_bytes, last_path, now_str, last_mode=None, prev_mode=None):
+    """帧差 → 运动序列 → 变化判定 → 落盘，返回 (result, 新的实际落盘路径 或 None)
+
+    帧差、运动序列、噪声模型对比上一次采集（prev_thumb_path，prev_mode 是它的光照模式）；
+    是否落整帧对比 last_path（.ref 指向的那张帧，last_mode 是它的光照模式）。
+    result["mode"] 给出新帧的模式，见 remember_capture
+    """
+    check = {"diff": 999.0, "changed": True, "keep": True, "mode": None, "reason": ""}
+    roi = cam.get("roi")
+    try:
+        thumb = load_thumb(img_bytes, roi)
+    except:
+        thumb = None
+    if thumb is not None and last_path and Path(last_path).exists():
+        try:
+            ref_thumb = load_thumb(last_path, roi)
+            prev_path = prev_thumb_path(name)
+            prev_thumb = Image.open(prev_path).convert("L") if prev_path.exists() else None
+            if prev_thumb is None or prev_thumb.size != CMP_SIZE:
+                # 没有上一次采集的缩略图（刚升级/刚启动）：退回对比引用目标
+                prev_thumb, prev_mode = ref_thumb, last_mode
+            check = detect_change(name, cam, prev_thumb, thumb, img_bytes, prev_mode, clock.time(),
+                                  ref_thumb, last_mode)
+        except:
+            pass
+    if thumb is not None:
+        try:
+            thumb.save(prev_thumb_path(name))
+        except:
+            pass
+    if check["mode"] is None and NOISE_ENABLED:
+        try:
+            check["mode"] = noise.lighting_mode(img_bytes)
+        except:
+            pass
+
+    diff, changed = check["diff"], check["changed"]
+    output_path, is_ref = store_frame(name, img_bytes, now_str, diff, check["keep"], last_path)
+
+    print(f"{'🔴' if changed else '⚪'} {name}: {len(img_bytes)//1024}KB diff={diff:.1f}"
+          + (f" {check['reason']}" if check["reason"] else "")
+          + (" → 引用上一帧" if is_ref else ""))
+    result = {"ok": True, "size": len(img_bytes), "diff": diff, "changed": changed, "ref": is_ref,
+              "mode": check["mode"]}
+    return result, None if is_ref else output_path
+
+
+def capture_camera(name, cam, last_path, now_str, go2rtc_ok, ys7_token, last_mode=None, prev_mode=None):
+    """单个摄像头：抓帧 → ingest_frame，返回 (result, 新的实际落盘路径 或 None)"""
+    try:
+        img_bytes = fetch_frame(cam, go2rtc_ok, ys7_token)
+        return ingest_frame(name, cam, img_bytes, last_path, now_str, last_mode, prev_mode)
+    except Exception as e:
+        print(f"❌ {name}: {e}")
+        return {"ok": False, "error": str(e)}, None
+
+
+def remember_capture(state, name, result, output_path):
+    """采集结果写回 state：prev_mode_ 每次采集都更新，last_/mode_（引用目标）只在落整帧时更新"""
+    if not result.get("ok"):
+        return
+    state[f"prev_mode_{name}"] = result.get("mode")
+    if output_path:
+        state[f"last_{name}"] = str(output_path)
+        state[f"mode_{name}"] = result.get("mode")
+
+
 def run_capture():
-    """执行一次采集，返回结果字典"""
+    """执行一次采集，返回结果字典
+
+    遍历注册表里需要轮询的摄像头，并行抓帧；猫眼等 poll=False 的走事件驱动（见 door_check.py）
+    """
     CAPTURE_DIR.mkdir(exist_ok=True)
-    now_str = datetime.now().strftime("%H%M")
+    now_str = clock.now().strftime("%H%M")
     state = load_state()
     results = {}
+    polled = cameras(polled=True)
+
+    # stream 模式：stream.py 正常出帧的摄像头已由流落盘，这里只在流断开时回退截图
+    if CAPTURE_MODE == "stream":
+        from stream import load_stream_status, fresh_streams
+        streaming = fresh_streams()
+        stream_status = load_stream_status()
+        for name in [name for name, _ in polled if name in streaming]:
+            diff = stream_status[name].get("diff")
+            diff = 999.0 if diff is None else diff
+            changed = stream_status[name].get("changed")
+            results[name] = {"ok": True, "stream": True, "diff": diff,
+                             "changed": diff > CAMERAS[name]["threshold"] if changed is None else changed}
+            print(f"📡 {name}: 流式采集中 diff={diff:.1f}")
+        polled = [(name, cam) for name, cam in polled if name not in streaming]
 
     # 健康检查
-    go2rtc_ok = check_go2rtc_health()
-    if not go2rtc_ok:
-        state["go2rtc_failures"] = state.get("go2rtc_failures", 0) + 1
-        print(f"⚠️ go2rtc 不在线 (连续{state['go2rtc_failures']}次)")
-    else:
-        state["go2rtc_failures"] = 0
-
-    # go2rtc 摄像头
-    for name, src in GO2RTC_CAMERAS.items():
+    go2rtc_ok = False
+    if any(cam["source"] == "go2rtc" for _, cam in polled):
+        go2rtc_ok = check_go2rtc_health()
+        if not go2rtc_ok:
+            state["go2rtc_failures"] = state.get("go2rtc_failures", 0) + 1
+            print(f"⚠️ go2rtc 不在线 (连续{state['go2rtc_failures']}次)")
+        else:
+            state["go2rtc_failures"] = 0
+
+    ys7_token = None
+    if any(cam["source"] == "ys7" for _, cam in polled):
         try:
-            if not go2rtc_ok:
-                raise ConnectionError("go2rtc offline")
-            img_bytes = capture_go2rtc(src)
-            output_path = CAPTURE_DIR / f"{name}_{now_str}.jpg"
-
-            last_key = f"last_{name}"
-            diff = 999.0
-            if last_key in state and Path(state[last_key]).exists():
-                diff = frame_diff(img_bytes, state[last_key])
-
-            output_path.write_bytes(img_bytes)
-            state[last_key] = str(output_path)
-
-            changed = diff > DIFF_THRESHOLD
-            results[name] = {"ok": True, "size": len(img_bytes), "diff": diff, "changed": changed}
-            print(f"{'🔴' if changed else '⚪'} {name}: {len(img_bytes)//1024}KB diff={diff:.1f}")
-
+            ys7_token = get_ys7_token(state)
         except Exception as e:
-            results[name] = {"ok": False, "error": str(e)}
-            print(f"❌ {name}: {e}")
-
-    # 猫眼不再轮询截图 — 改为事件驱动（见 door_check.py）
+            print(f"⚠️ 萤石 token 获取失败: {e}")
+
+    pool = worker_pool()
+    futures = {
+        name: pool.submit(capture_camera, name, cam, state.get(f"last_{name}"),
+                          now_str, go2rtc_ok, ys7_token, state.get(f"mode_{name}"),
+                          state.get(f"prev_mode_{name}"))
+        for name, cam in polled
+    }
+    for name, fut in futures.items():
+        results[name], output_path = fut.result()
+        remember_capture(state, name, results[name], output_path)
+
+    if CAPTURE_MODE == "stream" and streaming:
+        # 流式摄像头的 last_/mode_ 由 stream.py 写，保留它在这一轮期间写进去的值
+        fresh = load_state()
+        for name in streaming:
+            for key in frame_keys(name):
+                if key in fresh:
+                    state[key] = fresh[key]
 
     # 汇总
     any_change = any(r.get("changed", False) for r in results.values())
     any_failure = any(not r.get("ok", False) for r in results.values())
     state["last_capture"] = now_str
-    state["last_capture_ts"] = time.time()
+    state["last_capture_ts"] = clock.time()
     state["last_any_change"] = any_change
     state["last_any_failure"] = any_failure
     save_state(state)
 
     # 心跳
-    HEARTBEAT_FILE.write_text(str(time.time()))
+    HEARTBEAT_FILE.write_text(str(clock.time()))
 
-    # 清理30分钟前的旧图
-    cutoff = time.time() - 1800
-    for f in CAPTURE_DIR.glob("*.jpg"):
-        if f.stat().st_mtime < cutoff:
-            f.unlink()
+    cleanup_captures(state)
 
     return results
 
 
+def cleanup_captures(state):
+    """清理30分钟前的旧图（仍被引用的帧、每个摄像头最新落盘的帧保留）"""
+    cutoff = clock.time() - 1800
+    keep = {state[f"last_{name}"] for name in CAMERAS if f"last_{name}" in state}
+    old = []
+    for f in list_frames():
+        if f.stat().st_mtime >= cutoff:
+            if f.suffix == ".ref":
+                try:
+                    keep.add(str(resolve_frame(f)))
+                except:
+                    pass
+        else:
+            old.append(f)
+    for f in old:
+        if f.suffix == ".ref" or str(f) not in keep:
+            f.unlink(missing_ok=True)
+
+
 if __name__ == "__main__":
     run_capture()
@@ -0,0 +1,29 @@
+"""时钟：流水线里取“现在”统一走这里
+
+平时就是系统时间；replay.py 回放时切到模拟时钟，按录制帧的时间推进。
+"""
+
+import time as _time
+from datetime import datetime
+
+_sim_ts = None
+
+
+def time():
+    return _sim_ts if _sim_ts is not None else _time.time()
+
+
+def now():
+    return datetime.fromtimestamp(time())
+
+
+def set_time(ts):
+    """切到模拟时钟并设为 ts"""
+    global _sim_ts
+    _sim_ts = ts
+
+
+def reset():
+    """回到系统时间"""
+    global _sim_ts
+    _sim_ts = None
@@ -1,65 +1,273 @@
-"""集中配置 — 所有路径和参数在此管理"""
-import os
+"""集中配置 — 所有路径和参数在此管理
+
+多户：RUIRUI_PROFILES 指向 JSON 档案文件，RUIRUI_PROFILE 选其中一户。
+档案的 env 代替同名环境变量（路径、地址、webhook，派生路径跟着变），
+settings 在文件末尾覆盖同名常量（摄像头、阈值、预算等）。tenants.py 按户重新执行本文件。
+"""
+import os, sys, json
 from pathlib import Path
 
+# ── 多户档案 ──
+PROFILES_FILE = os.environ.get("RUIRUI_PROFILES")
+PROFILE = globals().get("PROFILE") or os.environ.get("RUIRUI_PROFILE")  # tenants.py 重新执行时预先注入
+
+
+def load_profiles():
+    """{"gemini_rate_per_min": N, "profiles": {户名: {"env": {...}, "settings": {...}}}}"""
+    if not PROFILES_FILE:
+        return {}
+    return json.loads(Path(PROFILES_FILE).read_text())
+
+
+_profiles = load_profiles()
+_profile = _profiles.get("profiles", {}).get(PROFILE) if PROFILE else {}
+if _profile is None:
+    raise KeyError(f"档案文件 {PROFILES_FILE} 里没有 {PROFILE}")
+
+
+def project_modules():
+    """本项目已导入的模块：按同名覆盖配置常量时遍历（tenants.py 切户、replay.py --set）"""
+    root = Path(__file__).resolve().parent
+    return [m for m in list(sys.modules.values())
+            if getattr(m, "__file__", None) and Path(m.__file__).resolve().parent == root]
+
+
+def _env(name, default=None):
+    """档案 env 优先，其次进程环境变量"""
+    return _profile.get("env", {}).get(name, os.environ.get(name, default))
+
+
 # ── 路径 ──
-CAPTURE_DIR = Path(os.environ.get("RUIRUI_CAPTURE_DIR", "/tmp/ruirui_captures"))
-LOG_DIR = Path(os.environ.get("RUIRUI_LOG_DIR",
+CAPTURE_DIR = Path(_env("RUIRUI_CAPTURE_DIR", "/tmp/ruirui_captures"))
+LOG_DIR = Path(_env("RUIRUI_LOG_DIR",
     os.path.expanduser("~/.openclaw/workspace/memory")))
 STATE_FILE = CAPTURE_DIR / "tracker_state.json"
-HEARTBEAT_FILE = Path("/tmp/ruirui_heartbeat")
+HEARTBEAT_FILE = Path(_env("RUIRUI_HEARTBEAT_FILE", "/tmp/ruirui_heartbeat"))
 STATS_FILE = LOG_DIR / "ruirui_stats.json"
+REPORT_CACHE_FILE = LOG_DIR / "ruirui_report_cache.json"
+REPORT_CACHE_DAYS = 7
+INDEX_DB = LOG_DIR / "ruirui_index.sqlite"
+TREND_CACHE_FILE = LOG_DIR / "ruirui_trend_cache.json"
+TREND_WORKERS = int(os.environ.get("RUIRUI_TREND_WORKERS", os.cpu_count() or 1))
+TREND_MIN_NAP_MIN = 15      # 短于此的 sleeping 段不算一觉（误读/翻身）
+FRAME_ARCHIVE_DIR = Path(_env("RUIRUI_ARCHIVE_DIR",
+    os.path.expanduser("~/.openclaw/ruirui_archive")))
+MOTION_DIR = Path(_env("RUIRUI_MOTION_DIR", str(LOG_DIR / "motion")))
+NOISE_DIR = LOG_DIR / "noise"
 
 # ── 凭证（文件路径，运行时读取） ──
-GEMINI_KEY_PATH = os.environ.get("GEMINI_KEY_PATH", os.path.expanduser("~/.gemini_key"))
-HA_TOKEN_PATH = os.environ.get("HA_TOKEN_PATH", os.path.expanduser("~/.ha_token"))
-YS7_APPKEY_PATH = os.environ.get("YS7_APPKEY_PATH", os.path.expanduser("~/.ys7_appkey"))
-YS7_SECRET_PATH = os.environ.get("YS7_SECRET_PATH", os.path.expanduser("~/.ys7_secret"))
+GEMINI_KEY_PATH = _env("GEMINI_KEY_PATH", os.path.expanduser("~/.gemini_key"))
+HA_TOKEN_PATH = _env("HA_TOKEN_PATH", os.path.expanduser("~/.ha_token"))
+YS7_APPKEY_PATH = _env("YS7_APPKEY_PATH", os.path.expanduser("~/.ys7_appkey"))
+YS7_SECRET_PATH = _env("YS7_SECRET_PATH", os.path.expanduser("~/.ys7_secret"))
+STATUS_TOKEN_PATH = _env("RUIRUI_STATUS_TOKEN_PATH", os.path.expanduser("~/.ruirui_status_token"))
 
 # ── go2rtc ──
-GO2RTC_URL = os.environ.get("GO2RTC_URL", "http://192.168.2.24:2984")
-GO2RTC_CAMERAS = {
-    "bedroom": "c302_4021",
-    "living": "c302_4243",
-}
-
-# ── 萤石云（猫眼） ──
-YS7_CAMERAS = {
-    "door": "K66700907",
-}
+GO2RTC_URL = _env("GO2RTC_URL", "http://192.168.2.24:2984")
 
 # ── Home Assistant ──
-HA_URL = os.environ.get("HA_URL", "http://192.168.2.24:8123")
+HA_URL = _env("HA_URL", "http://192.168.2.24:8123")
+HA_ENABLED = _env("RUIRUI_HA", "1") != "0"   # 没有 token 文件时自动不用
 
 # ── OpenClaw webhook（告警通知，备用） ──
-OPENCLAW_HOOK_URL = os.environ.get("OPENCLAW_HOOK_URL", "http://127.0.0.1:18789/hooks")
-OPENCLAW_HOOK_TOKEN = os.environ.get("OPENCLAW_HOOK_TOKEN", "")
+OPENCLAW_HOOK_URL = _env("OPENCLAW_HOOK_URL", "http://127.0.0.1:18789/hooks")
+OPENCLAW_HOOK_TOKEN = _env("OPENCLAW_HOOK_TOKEN", "")
 
 # ── 飞书群机器人 webhook（主通知渠道） ──
-FEISHU_BOT_WEBHOOK = os.environ.get("FEISHU_BOT_WEBHOOK",
+FEISHU_BOT_WEBHOOK = _env("FEISHU_BOT_WEBHOOK",
     "https://open.feishu.cn/open-apis/bot/v2/hook/d5bd8fc9-f951-4872-b94b-159b97a4a55a")
 
 # ── 分析参数 ──
 GEMINI_MODEL = "gemini-2.5-pro"
+# 模型级联：先问快速模型，置信度高且不会引发告警的结果直接采用，否则升级到 GEMINI_MODEL
+GEMINI_CASCADE = True
+GEMINI_FAST_MODEL = "gemini-2.5-flash"
+CASCADE_ACCEPT_CONFIDENCE = ("高",)  # 快速模型给出这些置信度才采用
+GEMINI_API_BASE = _env("GEMINI_API_BASE",
+    "https://generativelanguage.googleapis.com/v1beta")
 MAX_PER_CAM = 5
 MAX_DOOR_FRAMES = 2
 RESIZE_WIDTH = 800
 DIFF_THRESHOLD = 8.0
+KEYFRAME_DIFF_THRESHOLD = 4.0  # 相邻帧差超过此值才算关键变化（比 L1 阈值低，相邻帧间隔短）
 CMP_SIZE = (160, 120)
 FORCE_ANALYZE_MIN = 30
 
+# ── 摄像头注册表 ──
+# source:   go2rtc（src=流名）/ ys7（src=设备序列号）/ mjpeg（src=完整 URL）
+# role:     indoor = 参与 Gemini 分析；door = 猫眼，事件驱动（见 door_check.py）
+# priority: 越小越靠前（采样、prompt 顺序）
+# quota:    每次分析最多采样张数
+# roi:      帧差只看的区域 (x0, y0, x1, y1)，按画面比例，None = 全画面
+# poll:     是否每分钟截图
+# ha:       该位置对应的 Home Assistant 实体（可选，见 ha.py）：light / motion / media / contact
+# 加摄像头只需在这里加一项
+CAMERAS = {
+    "bedroom": {
+        "source": "go2rtc", "src": "c302_4021", "role": "indoor",
+        "label": "卧室", "description": "卧室（婴儿房，粉色墙，蚊帐婴儿床）",
+        "priority": 1, "quota": MAX_PER_CAM, "threshold": DIFF_THRESHOLD, "roi": None,
+        "ha": {"light": "light.bedroom", "motion": "binary_sensor.bedroom_motion"},
+    },
+    "living": {
+        "source": "go2rtc", "src": "c302_4243", "role": "indoor",
+        "label": "客厅", "description": "客厅（活动区，彩色玩具）",
+        "priority": 2, "quota": MAX_PER_CAM, "threshold": DIFF_THRESHOLD, "roi": None,
+        "ha": {"light": "light.living_room", "motion": "binary_sensor.living_room_motion",
+               "media": "media_player.living_room_tv"},
+    },
+    "door": {
+        "source": "ys7", "src": "K66700907", "role": "door",
+        "label": "猫眼", "description": "门口猫眼（门外走廊）",
+        "priority": 3, "quota": MAX_DOOR_FRAMES, "threshold": DIFF_THRESHOLD, "roi": None,
+        "poll": False, "ha": {"contact": "binary_sensor.front_door"},
+    },
+}
+CAPTURE_WORKERS = 4
+CAPTURE_DEDUP = True               # 无变化帧只写 .ref 引用，不重复写 JPEG
+
+# ── 关键帧归档（archive.py） ──
+FRAME_ARCHIVE_ENABLED = _env("RUIRUI_ARCHIVE", "1") != "0"
+FRAME_ARCHIVE_RETENTION_DAYS = {   # 每级保留天数
+    "transition": 30,
+    "analyzed": 7,
+    "static": 3,
+}
+FRAME_ARCHIVE_QUOTA_MB = 2048      # 总配额，超出按 static → analyzed → transition 淘汰
+FRAME_ARCHIVE_DUP_DIST = 4         # dHash 汉明距离 ≤ N 视为近似重复
+FRAME_ARCHIVE_DUP_LUMA = 12       # 平均亮度差 ≤ N（区分开关灯）
+FRAME_ARCHIVE_DUP_WINDOW = 50      # 只和同摄像头最近N个对象比较
+
+# ── 运动能量时间序列（motion.py） ──
+MOTION_CADENCE_SEC = 60            # 每槽秒数
+MOTION_GRID = (2, 2)               # 区域划分（列 × 行）
+
+# ── 自适应噪声底（noise.py） ──
+# 变化判定不再用固定阈值：按 摄像头 × 光照模式 学习帧差分布，z 分数超过 NOISE_Z 才算变化
+NOISE_ENABLED = True
+NOISE_Z = 4.0                      # 偏离底噪多少个标准差算变化
+NOISE_ALPHA = 0.05                 # 指数加权步长（≈最近20个样本）
+NOISE_MIN_STD = 1.0                # 标准差下限，防止极静画面上一点噪声就触发
+NOISE_MIN_SAMPLES = 12             # 样本不足时退回摄像头固定阈值
+NOISE_IR_CHROMA = 4.0              # 色度低于此值视为夜视（红外黑白画面）
+NOISE_DARK_LUMA = 40               # 彩色但平均亮度低于此值视为暗光
+
+# ── Home Assistant 信号（ha.py，实体在 CAMERAS[...]["ha"] 里登记） ──
+HA_STATE_FILE = CAPTURE_DIR / "ha_states.json"  # ha.py watch 常驻进程写的快照
+HA_FRESH_SEC = 120                 # 快照超过N秒没更新视为 watch 不在，改为现场批量拉取
+HA_POLL_SEC = 10                   # watch 无 websocket 时的轮询间隔
+HA_MOTION_QUIET_MIN = 10           # 人体传感器N分钟内触发过算“有动静”
+
+# ── 状态服务（server.py） ──
+STATUS_HOST = os.environ.get("RUIRUI_STATUS_HOST", "127.0.0.1")
+STATUS_CORS_ORIGIN = os.environ.get("RUIRUI_STATUS_CORS_ORIGIN", "")  # 允许跨域访问的唯一来源，空 = 不允许
+STATUS_PORT = int(os.environ.get("RUIRUI_STATUS_PORT", "8790"))
+STATUS_LONGPOLL_MAX_SEC = 60       # 长轮询最多挂起N秒
+STATUS_SSE_KEEPALIVE_SEC = 15      # SSE 无变化时每N秒发一次注释保活
+STATUS_REFRESH_SEC = 10            # --no-pipeline 时从文件刷新快照的间隔
+
+# ── 流式采集（stream.py 常驻进程） ──
+# snapshot = 每分钟请求 frame.jpeg；stream = 由 stream.py 持有 MJPEG 长连接并落盘
+CAPTURE_MODE = _env("RUIRUI_CAPTURE_MODE", "snapshot")
+STREAM_STATUS_FILE = CAPTURE_DIR / "stream_status.json"
+STREAM_PERSIST_SEC = 60            # 每N秒落盘一帧（<60 时文件名带秒）
+STREAM_STATUS_SEC = 5              # 状态文件刷新间隔
+STREAM_STALE_SEC = 30              # 超过N秒没新帧视为流断开，capture.py 回退截图
+STREAM_RECONNECT_BACKOFF = [2, 5, 10, 30]
+
+
+def cameras(role=None, polled=None):
+    """按优先级返回 [(name, cam)]，可按 role / 是否轮询过滤"""
+    items = [
+        (name, cam) for name, cam in CAMERAS.items()
+        if (role is None or cam["role"] == role)
+        and (polled is None or cam.get("poll", True) == polled)
+    ]
+    return sorted(items, key=lambda x: x[1]["priority"])
+
+
+# 兼容旧配置名
+GO2RTC_CAMERAS = {n: c["src"] for n, c in CAMERAS.items() if c["source"] == "go2rtc"}
+YS7_CAMERAS = {n: c["src"] for n, c in CAMERAS.items() if c["source"] == "ys7"}
+
+# ── Gemini 限速（多户共用一个进程时按户公平分配） ──
+GEMINI_RATE_PER_MIN = int(os.environ.get("RUIRUI_GEMINI_RATE_PER_MIN",
+    _profiles.get("gemini_rate_per_min", 0)))   # 0 = 不限
+GEMINI_RATE_WAIT_SEC = 60          # 排不到额度最多等N秒（tenants.py 串行时不等，本轮分析顺延）
+
+# ── Gemini 指令缓存 ──
+GEMINI_CACHE_ENABLED = True
+GEMINI_CACHE_FILE = CAPTURE_DIR / "gemini_cache.json"
+GEMINI_CACHE_TTL_SEC = 3600        # cachedContents 存活时间
+GEMINI_CACHE_REFRESH_SEC = 300     # 剩余不足N秒时提前重建
+
+# ── 批量重标（batch.py） ──
+BATCH_DIR = LOG_DIR / "relabel"     # 重标日志和断点文件
+BATCH_WINDOWS_PER_JOB = 15         # 每个批量任务包含的分析窗口数（内联请求总大小上限 20MB）
+BATCH_MAX_INFLIGHT = 2             # 同时在跑的批量任务数
+BATCH_POLL_SEC = 30                # 轮询任务状态间隔
+BATCH_DONE_STATES = ("BATCH_STATE_SUCCEEDED", "BATCH_STATE_FAILED",
+                     "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED")
+
 # ── 告警阈值 ──
 ALERT_ALONE_AWAKE_MIN = 5      # 独自清醒超过N分钟告警
 ALERT_LONG_SLEEP_MIN = 180     # 连续睡觉超过N分钟提醒
 ALERT_UNKNOWN_MIN = 20         # 连续unknown超过N分钟告警
 EVENT_DEDUP_MIN = 30           # 同一事件N分钟内不重复通知
 
+# ── 状态平滑（state.py） ──
+STATE_CONFIRM_WEIGHT = 1.5     # 新状态累积证据达到此值才确认切换
+CONFIDENCE_WEIGHTS = {"高": 1.0, "中": 0.6, "低": 0.3, None: 1.0}  # 每次观测的证据（None = 没给置信度）
+STATE_IMMEDIATE = ("alone_awake",)  # 这些状态一次观测就确认，不能延迟告警
+
 # ── 运行时间 ──
 RUN_HOUR_START = 7
 RUN_HOUR_END = 22
+ANALYZE_EVERY_MIN = 10         # 每N分钟分析一次
+
+# ── 预算调节（governor.py） ──
+GOVERNOR_ENABLED = True
+GOVERNOR_DAILY_BUDGET_USD = 0.15   # 每日 Gemini 预算，0 = 不调节（同 GOVERNOR_ENABLED = False）
+GOVERNOR_LATENCY_TARGET_S = 20     # 单次分析往返目标，超过则再降一档采样/分辨率
+GOVERNOR_LATENCY_WINDOW = 5        # 按最近N次调用算平均延迟
+GOVERNOR_PACE_STEPS = [1.0, 1.5, 2.0]  # 花费进度超过这些值依次升档
+GOVERNOR_LEVELS = [                # 档位 0 = 不限制（None 取 RESIZE_WIDTH / FORCE_ANALYZE_MIN）；花完预算到最后一档
+    {"quota_scale": 1.0, "width": None, "force_min": None},
+    {"quota_scale": 0.6, "width": 640, "force_min": 45},
+    {"quota_scale": 0.4, "width": 512, "force_min": 60},
+    {"quota_scale": 0.2, "width": 384, "force_min": 120},
+]
+GOVERNOR_LOG_FILE = LOG_DIR / "ruirui_governor.jsonl"
 
 # ── 重试 ──
 CAPTURE_MAX_RETRY = 3
 CAPTURE_RETRY_BACKOFF = [2, 5, 10]
 GEMINI_MAX_RETRY = 2
 GEMINI_RETRY_BACKOFF = [5, 15]
+
+
+# ── 档案覆盖 ──
+# 路径类常量只能走档案 env（RUIRUI_CAPTURE_DIR 等），否则 STATE_FILE 等派生路径仍指向默认目录
+_defaults = {"DIFF_THRESHOLD": DIFF_THRESHOLD, "MAX_PER_CAM": MAX_PER_CAM, "MAX_DOOR_FRAMES": MAX_DOOR_FRAMES}
+for _name, _value in _profile.get("settings", {}).items():
+    if _name not in globals() or not _name.isupper():
+        raise KeyError(f"档案 {PROFILE} 的 settings 里 {_name} 不是配置项")
+    if isinstance(globals()[_name], Path):
+        raise KeyError(f"档案 {PROFILE}：路径 {_name} 请在 env 里设置，不能放 settings")
+    globals()[_name] = _value
+if "CAMERAS" in _profile.get("settings", {}):
+    for _cam in CAMERAS.values():
+        _cam.setdefault("priority", 99)
+        _cam.setdefault("quota", MAX_PER_CAM if _cam["role"] == "indoor" else MAX_DOOR_FRAMES)
+        _cam.setdefault("threshold", DIFF_THRESHOLD)
+        _cam.setdefault("roi", None)
+else:
+    # 沿用全局阈值/配额的摄像头跟着档案改
+    for _cam in CAMERAS.values():
+        _quota = "MAX_PER_CAM" if _cam["role"] == "indoor" else "MAX_DOOR_FRAMES"
+        if _cam["quota"] == _defaults[_quota]:
+            _cam["quota"] = globals()[_quota]
+        if _cam["threshold"] == _defaults["DIFF_THRESHOLD"]:
+            _cam["threshold"] = DIFF_THRESHOLD
+GO2RTC_CAMERAS = {n: c["src"] for n, c in CAMERAS.items() if c["source"] == "go2rtc"}
+YS7_CAMERAS = {n: c["src"] for n, c in CAMERAS.items() if c["source"] == "ys7"}
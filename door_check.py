@@ -2,14 +2,18 @@
 
 不轮询截图，而是查萤石云告警API获取移动侦测事件+截图，
 然后用 Gemini 判断是否有婴儿车（出门/回来）。
+
+拉取（token、告警列表、下载截图）和判断（Gemini）分开：analyze.py 在 L1 触发时
+就和主分析并行预取，状态转换确实需要时才做婴儿车判断。
 """
 
-import time, io, base64, requests
+import time, io, json, base64, requests
 from datetime import datetime
 from pathlib import Path
 from PIL import Image
 
 from config import *
+from gemini import generate
 
 
 DOOR_PROMPT = """你看到的是门口猫眼（海康DP2C）的移动侦测告警截图，拍摄的是门外走廊。
@@ -24,7 +28,13 @@ DOOR_PROMPT = """你看到的是门口猫眼（海康DP2C）的移动侦测告
 
 
 def get_ys7_token():
-    """获取萤石云 access token"""
+    """获取萤石云 access token（优先复用 capture.py 缓存在状态文件里的）"""
+    try:
+        state = json.loads(STATE_FILE.read_text())
+        if state.get("ys7_token") and time.time() * 1000 < state.get("ys7_token_expire", 0) - 60000:
+            return state["ys7_token"]
+    except:
+        pass
     appkey = open(YS7_APPKEY_PATH).read().strip()
     secret = open(YS7_SECRET_PATH).read().strip()
     r = requests.post("https://open.ys7.com/api/lapp/token/get",
@@ -86,61 +96,68 @@ def check_stroller_gemini(images, gemini_key):
                 "data": base64.b64encode(resized).decode()
             }
         })
-    parts.append({"text": DOOR_PROMPT})
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={gemini_key}"
-    payload = {"contents": [{"parts": parts}]}
-
-    r = requests.post(url, json=payload, timeout=60)
-    r.raise_for_status()
-    result = r.json()["candidates"][0]["content"]["parts"][0]["text"].strip().upper()
-    return "YES" in result
-
-
-def check_door_event(direction, gemini_key):
+    result, usage = generate(GEMINI_MODEL, parts, gemini_key, system=DOOR_PROMPT, timeout=60)
+    print(f"🚪 ⏱️ {usage['latency_s']}s | tokens 输入{usage['prompt_tokens']}（缓存{usage['cached_tokens']}）")
+    return "YES" in result.upper()
+
+
+def fetch_door_alarms():
+    """拉取猫眼最近15分钟的告警和截图（不调 Gemini），返回 {"alarms": 条数, "images": [bytes]}"""
+    door_cams = [cam for _, cam in cameras("door") if cam["source"] == "ys7"]
+    if not door_cams:
+        return {"alarms": 0, "images": []}
+
+    token = get_ys7_token()
+    alarms = []
+    for cam in door_cams:
+        alarms += get_recent_alarms(token, cam["src"], minutes=15)
+
+    # 下载最近3张告警截图（去重、省成本）
+    images = []
+    for alarm in alarms[:3]:
+        pic_url = alarm.get("alarmPicUrl")
+        if not pic_url:
+            continue
+        try:
+            img = download_alarm_pic(pic_url)
+            images.append(img)
+        except Exception as e:
+            print(f"  ⚠️ 下载告警图片失败: {e}")
+    return {"alarms": len(alarms), "images": images}
+
+
+def check_door_event(direction, gemini_key, prefetch=None):
     """检查猫眼告警，判断是否有婴儿车出入
     
     Args:
         direction: "out" (锐锐消失→可能出门) 或 "in" (锐锐出现→可能回来)
         gemini_key: Gemini API key
+        prefetch: 已提交的 fetch_door_alarms Future（并行预取），None 则现场拉取
     
     Returns:
         (has_stroller: bool, alarm_count: int)
     """
-    serial = list(YS7_CAMERAS.values())[0]  # K66700907
-    
     try:
-        token = get_ys7_token()
-        alarms = get_recent_alarms(token, serial, minutes=15)
-        
-        if not alarms:
+        fetched = prefetch.result() if prefetch else fetch_door_alarms()
+
+        if not fetched["alarms"]:
             print(f"🚪 猫眼：最近15分钟无告警")
             return False, 0
-        
-        print(f"🚪 猫眼：最近15分钟有{len(alarms)}条告警，下载截图分析...")
-        
-        # 下载最近3张告警截图（去重、省成本）
-        images = []
-        for alarm in alarms[:3]:
-            pic_url = alarm.get("alarmPicUrl")
-            if not pic_url:
-                continue
-            try:
-                img = download_alarm_pic(pic_url)
-                images.append(img)
-            except Exception as e:
-                print(f"  ⚠️ 下载告警图片失败: {e}")
-        
+
+        images = fetched["images"]
+        print(f"🚪 猫眼：最近15分钟有{fetched['alarms']}条告警，分析截图...")
+
         if not images:
             print(f"🚪 猫眼：告警截图下载失败")
-            return False, len(alarms)
+            return False, fetched["alarms"]
         
         # Gemini 判断有没有婴儿车
         has_stroller = check_stroller_gemini(images, gemini_key)
         emoji = "🍼" if has_stroller else "👤"
         print(f"🚪 猫眼：{emoji} {'有婴儿车!' if has_stroller else '无婴儿车（路人）'}（分析了{len(images)}张告警图）")
         
-        return has_stroller, len(alarms)
+        return has_stroller, fetched["alarms"]
         
     except Exception as e:
         print(f"🚪 猫眼检查失败: {e}")
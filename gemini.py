@@ -0,0 +1,221 @@
+"""Gemini 客户端：统一请求 + 静态指令缓存 + 用量统计
+
+固定的分析指令（摄像头说明、识别规则）注册为 cachedContents，带 TTL，
+快过期时自动重建；每次请求只发送图片和少量动态上下文。
+指令太短达不到缓存下限、或缓存接口失败时，退回 systemInstruction 随请求发送。
+
+所有请求走同一个 Session（连接复用）；设置了 GEMINI_RATE_PER_MIN 时按户（PROFILE）公平限速。
+"""
+
+import time, json, hashlib, threading, requests
+
+from config import *
+
+SESSION = requests.Session()
+
+
+class RateLimited(Exception):
+    pass
+
+
+class RateLimiter:
+    """按户公平分配的调用限速（滑动60秒窗口）
+
+    最近一个分析周期内调用过的户平分 GEMINI_RATE_PER_MIN：自己那份随时可用；
+    超出时只能用其他户既没用掉、也没预留的余量。
+    """
+
+    def __init__(self):
+        self.blocking = True  # tenants.py 串行跑各户时关掉：排队只会卡住唯一的线程，改为立即失败
+        self.cond = threading.Condition()
+        self.calls = {}  # {户: [调用时间]}，最近60秒
+        self.seen = {}   # {户: 最近一次调用时间}
+
+    def allowed(self, tenant, now):
+        for t in self.calls:
+            self.calls[t] = [ts for ts in self.calls[t] if now - ts < 60]
+        active = {t for t, ts in self.seen.items() if now - ts < ANALYZE_EVERY_MIN * 60} | {tenant}
+        share = GEMINI_RATE_PER_MIN / len(active)
+        used = {t: len(self.calls.get(t, [])) for t in active}
+        total = sum(len(q) for q in self.calls.values())
+        if total >= GEMINI_RATE_PER_MIN:
+            return False
+        if used[tenant] < share:
+            return True
+        reserved = sum(max(0, share - used[t]) for t in active if t != tenant)
+        return total + reserved < GEMINI_RATE_PER_MIN
+
+    def acquire(self, tenant, timeout=None):
+        if not GEMINI_RATE_PER_MIN:
+            return
+        timeout = GEMINI_RATE_WAIT_SEC if timeout is None else timeout
+        deadline = time.time() + timeout
+        with self.cond:
+            waited = False
+            while not self.allowed(tenant, time.time()):
+                remaining = deadline - time.time()
+                if not self.blocking or remaining <= 0:
+                    raise RateLimited(f"{tenant} 超出 Gemini 限速 {GEMINI_RATE_PER_MIN}/min")
+                if not waited:
+                    print(f"⏳ Gemini 限速：{tenant} 排队中")
+                    waited = True
+                self.cond.wait(min(remaining, 1.0))
+            now = time.time()
+            self.calls.setdefault(tenant, []).append(now)
+            self.seen[tenant] = now
+
+
+LIMITER = RateLimiter()
+
+
+def _load_cache():
+    try:
+        return json.loads(GEMINI_CACHE_FILE.read_text())
+    except:
+        return {}
+
+
+def _save_cache(cache):
+    try:
+        GEMINI_CACHE_FILE.parent.mkdir(exist_ok=True)
+        GEMINI_CACHE_FILE.write_text(json.dumps(cache))
+    except Exception as e:
+        print(f"⚠️ 指令缓存索引写入失败: {e}")
+
+
+def _cache_key(model, instruction):
+    return hashlib.sha1(f"{model}\n{instruction}".encode()).hexdigest()[:16]
+
+
+def get_cached_instruction(model, instruction, key):
+    """返回指令对应的 cachedContents 名称，不可用时返回 None
+
+    创建失败也记一条（name=None），TTL 内不再重复尝试。
+    """
+    digest = _cache_key(model, instruction)
+    cache = _load_cache()
+    entry = cache.get(digest)
+    now = time.time()
+    if entry and now < entry["expire"] - GEMINI_CACHE_REFRESH_SEC:
+        return entry["name"]
+
+    name = None
+    try:
+        r = SESSION.post(f"{GEMINI_API_BASE}/cachedContents?key={key}", json={
+            "model": f"models/{model}",
+            "systemInstruction": {"parts": [{"text": instruction}]},
+            "ttl": f"{GEMINI_CACHE_TTL_SEC}s",
+        }, timeout=30)
+        r.raise_for_status()
+        name = r.json()["name"]
+        print(f"🗂️ 指令缓存已注册: {name}")
+    except Exception as e:
+        print(f"⚠️ 指令缓存不可用，改用 systemInstruction: {e}")
+
+    cache = {k: v for k, v in cache.items() if v["expire"] > now}
+    cache[digest] = {"name": name, "expire": now + GEMINI_CACHE_TTL_SEC}
+    _save_cache(cache)
+    return name
+
+
+def invalidate_cached_instruction(model, instruction):
+    cache = _load_cache()
+    cache.pop(_cache_key(model, instruction), None)
+    _save_cache(cache)
+
+
+def build_payload(parts, system=None, cached=None):
+    """generateContent 请求体（实时调用和批量任务共用）"""
+    payload = {"contents": [{"role": "user", "parts": parts}]}
+    if cached:
+        payload["cachedContent"] = cached
+    elif system:
+        payload["systemInstruction"] = {"parts": [{"text": system}]}
+    return payload
+
+
+def parse_response(data, model, latency=0.0):
+    """GenerateContentResponse → (text, usage)"""
+    text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
+    meta = data.get("usageMetadata", {})
+    usage = {
+        "model": model,
+        "latency_s": round(latency, 2),
+        "prompt_tokens": meta.get("promptTokenCount", 0),
+        "cached_tokens": meta.get("cachedContentTokenCount", 0),
+        "output_tokens": meta.get("candidatesTokenCount", 0),
+    }
+    return text, usage
+
+
+def generate(model, parts, key, system=None, timeout=120, max_retry=1, backoff=None):
+    """调用 generateContent，返回 (text, usage)
+
+    usage: model / latency_s / prompt_tokens / cached_tokens / output_tokens
+    """
+    backoff = backoff or GEMINI_RETRY_BACKOFF
+    cached = None
+    if system and GEMINI_CACHE_ENABLED:
+        cached = get_cached_instruction(model, system, key)
+
+    url = f"{GEMINI_API_BASE}/models/{model}:generateContent?key={key}"
+    # 一次调用只占一个限速名额：缓存失效重发和重试都不再排队，也不会在调用中途抛 RateLimited
+    LIMITER.acquire(PROFILE or "default")  # 排不到抛 RateLimited，不重试
+    last_err = None
+    i = 0
+    while i < max_retry:
+        try:
+            t0 = time.time()
+            r = SESSION.post(url, json=build_payload(parts, system, cached), timeout=timeout)
+            if cached and r.status_code in (400, 403, 404):
+                # 缓存被提前回收/过期 → 作废后立即改用 systemInstruction 重发，不计入重试
+                print(f"⚠️ 指令缓存失效 ({r.status_code})，改用 systemInstruction")
+                invalidate_cached_instruction(model, system)
+                cached = None
+                continue
+            r.raise_for_status()
+            return parse_response(r.json(), model, time.time() - t0)
+        except Exception as e:
+            last_err = e
+            if i < max_retry - 1:
+                time.sleep(backoff[min(i, len(backoff) - 1)])
+        i += 1
+    raise last_err
+
+
+# ── 批量任务（batchGenerateContent，异步、半价） ──
+
+def batch_submit(model, items, key, display_name):
+    """提交一批内联请求 [(request_key, payload)]，返回任务名（batches/...）"""
+    body = {"batch": {
+        "display_name": display_name,
+        "input_config": {"requests": {"requests": [
+            {"request": payload, "metadata": {"key": request_key}} for request_key, payload in items
+        ]}},
+    }}
+    r = SESSION.post(f"{GEMINI_API_BASE}/models/{model}:batchGenerateContent?key={key}",
+                      json=body, timeout=300)
+    r.raise_for_status()
+    return r.json()["name"]
+
+
+def batch_get(name, key, model):
+    """查询任务，返回 (state, results)；未结束时 results 为 None
+
+    results: {request_key: (text, usage) 或 (None, 错误信息)}
+    """
+    r = SESSION.get(f"{GEMINI_API_BASE}/{name}?key={key}", timeout=60)
+    r.raise_for_status()
+    data = r.json()
+    state = data.get("metadata", {}).get("state") or data.get("state", "")
+    if not data.get("done") and state not in BATCH_DONE_STATES:
+        return state, None
+    inlined = data.get("response", {}).get("inlinedResponses", {}).get("inlinedResponses", [])
+    results = {}
+    for item in inlined:
+        request_key = item.get("metadata", {}).get("key")
+        try:
+            results[request_key] = parse_response(item["response"], model)
+        except Exception:
+            results[request_key] = (None, str(item.get("error") or item.get("response"))[:200])
+    return state, results
@@ -0,0 +1,92 @@
+"""预算调节：按当天花费进度和最近调用延迟，动态调整每次分析的采样张数、分辨率和强制分析间隔
+
+update_stats 只记账，这里根据账本做决定：
+- 花费进度 = 今日已花 / (日预算 × 运行时段已过比例)，超前越多档位越高
+- 最近几次调用平均延迟超过目标 → 采样张数/分辨率再降一档（不影响强制间隔）
+- 锐锐可能独自清醒、或状态连续不明时豁免，照常全量分析
+每次决定追加写到 GOVERNOR_LOG_FILE（jsonl）并打印一行。
+"""
+
+import json
+
+from config import *
+import clock
+from state import load_baby_state
+
+
+def spend_pace(day, now):
+    """(今日花费, 进度比)：进度比 1.0 = 正好按预算均匀花"""
+    spent = day.get("cost_usd", 0.0)
+    window = max((RUN_HOUR_END - RUN_HOUR_START) * 60, 1)
+    elapsed = (now.hour - RUN_HOUR_START) * 60 + now.minute
+    fraction = min(1.0, max(elapsed, ANALYZE_EVERY_MIN, 1) / window)
+    budget = GOVERNOR_DAILY_BUDGET_USD * fraction
+    return spent, spent / budget if budget > 0 else 0.0
+
+
+def recent_latency(stats, today):
+    """今日最近几次调用的平均往返时间（秒），没有记录返回 None"""
+    calls = [c for c in stats.get("recent_calls", []) if c.get("time", "").startswith(today)]
+    calls = calls[-GOVERNOR_LATENCY_WINDOW:]
+    if not calls:
+        return None
+    return sum(c.get("latency_s", 0) for c in calls) / len(calls)
+
+
+def exempt_reason(baby_state):
+    if baby_state.get("status") == "alone_awake":
+        return "可能独自清醒"
+    if baby_state.get("status") == "unknown" or baby_state.get("consecutive_unknown", 0) > 0:
+        return "状态不明待确认"
+    return None
+
+
+def decide(stats):
+    """本次分析的参数：{level, quota: {摄像头: 张数}, width, force_min, ...}"""
+    now = clock.now()
+    today = now.strftime("%Y-%m-%d")
+    day = stats.get("daily", {}).get(today, {})
+    spent, pace = spend_pace(day, now)
+    latency = recent_latency(stats, today)
+
+    if spent >= GOVERNOR_DAILY_BUDGET_USD:
+        cost_level = len(GOVERNOR_LEVELS) - 1
+    else:
+        cost_level = sum(1 for limit in GOVERNOR_PACE_STEPS if pace > limit)
+    size_level = cost_level
+    if latency is not None and latency > GOVERNOR_LATENCY_TARGET_S:
+        size_level = min(size_level + 1, len(GOVERNOR_LEVELS) - 1)
+
+    exempt = exempt_reason(load_baby_state())
+    if exempt:
+        cost_level = size_level = 0
+
+    size, force = GOVERNOR_LEVELS[size_level], GOVERNOR_LEVELS[cost_level]
+    decision = {
+        "time": now.strftime("%Y-%m-%d %H:%M"),
+        "spent_usd": round(spent, 4),
+        "pace": round(pace, 2),
+        "latency_s": None if latency is None else round(latency, 1),
+        "level": max(cost_level, size_level),
+        "exempt": exempt,
+        "quota": {name: max(1, round(cam["quota"] * size["quota_scale"]))
+                  for name, cam in cameras("indoor")},
+        "width": size["width"] or RESIZE_WIDTH,
+        "force_min": force["force_min"] or FORCE_ANALYZE_MIN,
+    }
+    log_decision(decision)
+    return decision
+
+
+def log_decision(decision):
+    lat = "-" if decision["latency_s"] is None else f"{decision['latency_s']}s"
+    print(f"🎛️ 预算 ${decision['spent_usd']:.4f}/${GOVERNOR_DAILY_BUDGET_USD} 进度{decision['pace']}"
+          f" 延迟{lat} → 档位{decision['level']}"
+          + (f"（豁免：{decision['exempt']}）" if decision["exempt"] else "")
+          + f" 采样{sum(decision['quota'].values())}张 宽{decision['width']} 强制{decision['force_min']}min")
+    try:
+        GOVERNOR_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(GOVERNOR_LOG_FILE, "a") as f:
+            f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"⚠️ 预算决策日志写入失败: {e}")
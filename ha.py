@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""Home Assistant 信号：灯、门磁、人体传感器、媒体播放器的最新状态
+
+HA 很便宜地知道开关灯、开门、有人走动、在放电视，用来给分析做触发和门控：
+- 门开了（上次分析之后）→ 不等10分钟，马上分析
+- 房间都关灯、没动静、没在放东西，画面又没变 → 跳过定期强制分析
+- 房间的灯直接取 HA 的，不用 Gemini 猜
+
+实体在 CAMERAS[...]["ha"] 里按位置登记。状态两种来源：
+- ha.py watch 常驻：websocket 订阅 state_changed（需要 websocket-client，没装则定时批量轮询），
+  内存里保留最新状态并写 HA_STATE_FILE
+- 没有新鲜快照时，分析进程现场 GET /api/states 批量拉一次
+
+用法:
+    python ha.py               # 打印当前状态和信号
+    python ha.py watch         # 常驻订阅
+    python ha.py stub [8124]   # 本地 HA 替身（GET /api/states，POST /api/states/<id> 改状态）
+"""
+
+import sys, json, time, threading, requests
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import *
+import clock
+
+# 进程内的最新状态 {entity_id: {"state": str, "changed": 时间戳, "opened": 时间戳}}，opened 见 merge_states
+_states = {}
+_fetched_at = 0.0
+_lock = threading.Lock()
+
+
+def load_token():
+    try:
+        return open(HA_TOKEN_PATH).read().strip()
+    except:
+        return None
+
+
+def entities():
+    """{entity_id: (摄像头名, 种类)}"""
+    result = {}
+    for name, cam in CAMERAS.items():
+        for kind, entity_id in cam.get("ha", {}).items():
+            result[entity_id] = (name, kind)
+    return result
+
+
+def parse_state(raw):
+    changed = raw.get("last_changed")
+    try:
+        changed = datetime.fromisoformat(changed.replace("Z", "+00:00")).timestamp()
+    except:
+        changed = 0.0
+    return {"state": raw.get("state"), "changed": changed}
+
+
+def merge_states(old, new):
+    """新拉到的状态并进旧状态，返回合并后的新状态
+
+    opened = 最近一次看到 关→开 的时刻（门磁只在开门时触发分析）。不能只看 last_changed：
+    关门也会变，HA 重启会把所有实体的 last_changed 重置成启动时刻；第一次见到的实体不算开门。
+    """
+    merged = {}
+    for entity_id, s in new.items():
+        prev = old.get(entity_id)
+        s = dict(s)
+        if prev and prev["state"] == "off" and s["state"] == "on":
+            s["opened"] = s["changed"]
+        else:
+            s["opened"] = prev.get("opened", 0.0) if prev else 0.0
+        merged[entity_id] = s
+    return merged
+
+
+def fetch_states(token):
+    """批量拉取 /api/states，只保留登记过的实体"""
+    r = requests.get(f"{HA_URL}/api/states", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    r.raise_for_status()
+    wanted = entities()
+    return {s["entity_id"]: parse_state(s) for s in r.json() if s.get("entity_id") in wanted}
+
+
+def save_snapshot(source):
+    with _lock:
+        data = {"updated": time.time(), "source": source, "states": dict(_states)}
+    try:
+        HA_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        HA_STATE_FILE.write_text(json.dumps(data))
+    except Exception as e:
+        print(f"⚠️ HA 快照写入失败: {e}")
+
+
+def snapshot():
+    """最新状态：进程内 → watch 写的快照文件 → 现场批量拉取；HA 不可用时返回 {}"""
+    global _states, _fetched_at
+    if not HA_ENABLED or not entities():
+        return {}
+    if time.time() - _fetched_at < HA_FRESH_SEC:
+        return _states
+    previous = _states
+    try:
+        data = json.loads(HA_STATE_FILE.read_text())
+        if time.time() - data["updated"] < HA_FRESH_SEC:
+            _states, _fetched_at = data["states"], data["updated"]
+            return _states
+        previous = previous or data["states"]
+    except:
+        pass
+    token = load_token()
+    if not token:
+        return {}
+    try:
+        _states, _fetched_at = merge_states(previous, fetch_states(token)), time.time()
+    except Exception as e:
+        print(f"⚠️ HA 状态拉取失败: {e}")
+        return {}
+    save_snapshot("fetch")  # 留给下一个进程比较开关门
+    return _states
+
+
+def room_signals(states=None):
+    """按位置汇总信号：{摄像头名: {light, motion, media, door}}，没登记的字段为 None
+
+    door 是门磁最近一次开门（关→开）的时刻，没见过开门为 None
+    """
+    states = snapshot() if states is None else states
+    now = clock.time()
+    signals = {}
+    for name, cam in CAMERAS.items():
+        ha = cam.get("ha", {})
+        sig = {"light": None, "motion": None, "media": None, "door": None}
+        if ha.get("light") in states:
+            sig["light"] = states[ha["light"]]["state"] == "on"
+        if ha.get("motion") in states:
+            s = states[ha["motion"]]
+            sig["motion"] = s["state"] == "on" or now - s["changed"] < HA_MOTION_QUIET_MIN * 60
+        if ha.get("media") in states:
+            sig["media"] = states[ha["media"]]["state"] == "playing"
+        if ha.get("contact") in states:
+            s = states[ha["contact"]]
+            sig["door"] = s.get("opened") or None
+        signals[name] = sig
+    return signals
+
+
+def last_door_open(states=None):
+    """门磁最近一次开门的时间戳，没有返回 0"""
+    return max((sig["door"] for sig in room_signals(states).values() if sig["door"]), default=0)
+
+
+def door_opened_since(ts, states=None):
+    """ts 之后有没有开过门"""
+    return last_door_open(states) > ts
+
+
+def door_pending():
+    """有还没处理过的开门 → scheduler 不等整10分钟立即分析
+
+    处理过 = 上次成功分析之后，或已经因这次变化触发过分析（last_door_trigger，分析失败也记下，
+    不会每分钟重试一次付费调用）
+    """
+    if not HA_ENABLED:
+        return False
+    states = snapshot()
+    if not states:
+        return False
+    try:
+        tracker = json.loads(STATE_FILE.read_text())
+    except:
+        tracker = {}
+    return door_opened_since(max(tracker.get("last_gemini_time", 0), tracker.get("last_door_trigger", 0)), states)
+
+
+def quiet_dark(states=None):
+    """室内各房间都有灯和人体传感器、全部关灯、没动静、没在放东西"""
+    signals = room_signals(states)
+    indoor = [signals[name] for name, _ in cameras("indoor")]
+    if not indoor:
+        return False
+    return all(sig["light"] is False and sig["motion"] is False and not sig["media"]
+               for sig in indoor)
+
+
+def room_light(room, states=None):
+    """Gemini 给的房间（如“卧室”、“客厅→卧室”）→ HA 里最后那个房间的灯，不知道返回 None"""
+    signals = room_signals(states)
+    for name, cam in sorted(cameras("indoor"), key=lambda x: room.rfind(x[1]["label"]), reverse=True):
+        if cam["label"] in room and signals[name]["light"] is not None:
+            return "开灯" if signals[name]["light"] else "关灯"
+    return None
+
+
+# ── watch 常驻 ──
+
+def apply_event(event):
+    data = event.get("data", {})
+    entity_id = data.get("entity_id")
+    if entity_id not in entities() or not data.get("new_state"):
+        return False
+    with _lock:
+        _states.update(merge_states(_states, {entity_id: parse_state(data["new_state"])}))
+    return True
+
+
+def watch_websocket(token):
+    """websocket 订阅 state_changed，断开抛异常"""
+    import websocket  # 可选依赖 websocket-client
+    ws_url = HA_URL.replace("http", "ws", 1) + "/api/websocket"
+    ws = websocket.create_connection(ws_url, timeout=60)
+    try:
+        json.loads(ws.recv())  # auth_required
+        ws.send(json.dumps({"type": "auth", "access_token": token}))
+        if json.loads(ws.recv()).get("type") != "auth_ok":
+            raise PermissionError("HA websocket 认证失败")
+        ws.send(json.dumps({"id": 1, "type": "subscribe_events", "event_type": "state_changed"}))
+        print(f"🏠 HA websocket 已订阅 {len(entities())} 个实体")
+        last_save = 0
+        while True:
+            try:
+                msg = json.loads(ws.recv())
+            except websocket.WebSocketTimeoutException:
+                msg = {}
+            changed = msg.get("type") == "event" and apply_event(msg["event"])
+            if changed or time.time() - last_save > HA_FRESH_SEC / 2:
+                save_snapshot("websocket")
+                last_save = time.time()
+    finally:
+        ws.close()
+
+
+def watch():
+    token = load_token()
+    if not token:
+        print(f"没有 HA token（{HA_TOKEN_PATH}）")
+        return
+    try:
+        import websocket  # noqa: F401
+        use_ws = True
+    except ImportError:
+        use_ws = False
+        print(f"未安装 websocket-client，每{HA_POLL_SEC}s 批量轮询")
+    while True:
+        try:
+            states = fetch_states(token)
+            with _lock:
+                _states.update(merge_states(_states, states))
+            save_snapshot("poll")
+            if use_ws:
+                watch_websocket(token)
+            else:
+                time.sleep(HA_POLL_SEC)
+        except KeyboardInterrupt:
+            return
+        except Exception as e:
+            print(f"❌ HA: {e}，{HA_POLL_SEC}s 后重试")
+            time.sleep(HA_POLL_SEC)
+
+
+# ── 本地替身 ──
+
+def run_stub(port=8124):
+    """最小 HA REST 替身：GET /api/states；POST /api/states/<entity_id> {"state": "on"} 改状态"""
+    start = datetime.fromtimestamp(time.time() - 3600).astimezone().isoformat()
+    stub_states = {entity_id: {"entity_id": entity_id, "state": "off", "last_changed": start}
+                   for entity_id in entities()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self.reply(401, {"message": "unauthorized"})
+            if self.path == "/api/states":
+                return self.reply(200, list(stub_states.values()))
+            entity_id = self.path.rsplit("/", 1)[-1]
+            if entity_id in stub_states:
+                return self.reply(200, stub_states[entity_id])
+            self.reply(404, {"message": "not found"})
+
+        def do_POST(self):
+            entity_id = self.path.rsplit("/", 1)[-1]
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            stub_states[entity_id] = {"entity_id": entity_id, "state": body.get("state", "off"),
+                                      "last_changed": datetime.now().astimezone().isoformat()}
+            self.reply(200, stub_states[entity_id])
+
+    print(f"🏠 HA 替身 http://127.0.0.1:{port}（{len(stub_states)} 个实体）")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "watch":
+        watch()
+    elif cmd == "stub":
+        run_stub(int(sys.argv[2]) if len(sys.argv) > 2 else 8124)
+    else:
+        for name, sig in room_signals().items():
+            print(f"{name}: {sig}")
+        print(f"静暗={quiet_dark()}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""运动能量时间序列：每个摄像头每天一个定长 float32 文件，mmap 读写
+
+文件布局：按 MOTION_CADENCE_SEC 把一天切成固定槽位，每槽 1 + 区域数 个 float32
+（全局帧差 + MOTION_GRID 各区域帧差），未写入的槽位为 NaN。
+槽位由时间戳直接算出 → 追加是 O(1) 的定点写入；区间读取是内存切片，不碰 JPEG 和日志。
+
+用法: python motion.py <camera> [YYYY-MM-DD]   # 打印当天每小时运动概况
+"""
+
+import sys, math, mmap, struct, time
+from array import array
+from datetime import datetime, timedelta
+
+from config import *
+import clock
+import capture  # 循环导入：capture 也导入本模块，只在调用时取 capture.thumb_diff
+
+GRID_X, GRID_Y = MOTION_GRID
+FIELDS = 1 + GRID_X * GRID_Y          # 全局 + 各区域
+SLOTS = 86400 // MOTION_CADENCE_SEC   # 每天槽位数
+RECORD = struct.Struct(f"<{FIELDS}f")
+NAN = float("nan")
+
+
+def motion_path(cam, day):
+    return MOTION_DIR / f"{cam}_{day}.f32"
+
+
+def _open(cam, day, create=False):
+    """返回 (file, mmap)；文件不存在且不创建时返回 (None, None)"""
+    path = motion_path(cam, day)
+    if not path.exists():
+        if not create:
+            return None, None
+        MOTION_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(RECORD.pack(*[NAN] * FIELDS) * SLOTS)
+    f = open(path, "r+b" if create else "rb")
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if create else mmap.ACCESS_READ)
+    return f, mm
+
+
+def motion_scores(prev_thumb, curr_thumb):
+    """[全局帧差, 区域1, 区域2, ...]，区域按行优先"""
+    scores = [capture.thumb_diff(prev_thumb, curr_thumb)]
+    w, h = curr_thumb.size
+    for gy in range(GRID_Y):
+        for gx in range(GRID_X):
+            box = (gx * w // GRID_X, gy * h // GRID_Y,
+                   (gx + 1) * w // GRID_X, (gy + 1) * h // GRID_Y)
+            scores.append(capture.thumb_diff(prev_thumb.crop(box), curr_thumb.crop(box)))
+    return scores
+
+
+def append(cam, scores, ts=None):
+    """写入 ts 所在槽位（同一槽位后写覆盖）"""
+    ts = ts or clock.time()
+    dt = datetime.fromtimestamp(ts)
+    slot = (dt.hour * 3600 + dt.minute * 60 + dt.second) // MOTION_CADENCE_SEC
+    f, mm = _open(cam, dt.strftime("%Y-%m-%d"), create=True)
+    try:
+        RECORD.pack_into(mm, slot * RECORD.size, *scores[:FIELDS])
+    finally:
+        mm.close()
+        f.close()
+
+
+def record(cam, prev_thumb, curr_thumb, ts=None):
+    """采集层调用：算分并写入，失败只打印不影响采集，返回全局帧差"""
+    scores = motion_scores(prev_thumb, curr_thumb)
+    try:
+        append(cam, scores, ts)
+    except Exception as e:
+        print(f"⚠️ {cam}: 运动序列写入失败: {e}")
+    return scores[0]
+
+
+def read_range(cam, start_ts, end_ts, field=0):
+    """读 [start_ts, end_ts) 的某个字段（0=全局，1..=区域）
+
+    返回 (槽位起始时间戳列表, array('f'))，缺失为 NaN；可跨天。
+    """
+    times, values = [], array("f")
+    day = datetime.fromtimestamp(start_ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day.timestamp() < end_ts:
+        day_ts = day.timestamp()
+        lo = max(0, int((start_ts - day_ts) // MOTION_CADENCE_SEC))
+        hi = min(SLOTS, math.ceil((end_ts - day_ts) / MOTION_CADENCE_SEC))
+        if hi > lo:
+            f, mm = _open(cam, day.strftime("%Y-%m-%d"))
+            if mm is None:
+                values.extend(array("f", [NAN]) * (hi - lo))
+            else:
+                try:
+                    mv = memoryview(mm).cast("f")
+                    values.extend(array("f", mv[lo * FIELDS + field:hi * FIELDS:FIELDS]))
+                    mv.release()
+                finally:
+                    mm.close()
+                    f.close()
+            times.extend(day_ts + i * MOTION_CADENCE_SEC for i in range(lo, hi))
+        day += timedelta(days=1)
+    return times, values
+
+
+def summarize(cam, start_ts, end_ts, threshold=None, field=0):
+    """区间概况：有效槽位数、均值、最大值、超过阈值的分钟数"""
+    threshold = CAMERAS[cam]["threshold"] if threshold is None else threshold
+    _, values = read_range(cam, start_ts, end_ts, field)
+    valid = [v for v in values if v == v]
+    active = sum(1 for v in valid if v > threshold)
+    return {
+        "samples": len(valid),
+        "mean": sum(valid) / len(valid) if valid else 0.0,
+        "max": max(valid, default=0.0),
+        "active_min": active * MOTION_CADENCE_SEC / 60,
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: motion.py <camera> [YYYY-MM-DD]"); sys.exit(1)
+    cam = sys.argv[1]
+    day = datetime.strptime(sys.argv[2], "%Y-%m-%d") if len(sys.argv) > 2 else \
+        datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for h in range(24):
+        start = (day + timedelta(hours=h)).timestamp()
+        s = summarize(cam, start, start + 3600)
+        if s["samples"]:
+            print(f"{h:02d}:00  样本{s['samples']:3d}  均值{s['mean']:6.1f}  "
+                  f"最大{s['max']:6.1f}  活跃{s['active_min']:.0f}min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""自适应噪声底：按 摄像头 × 光照模式 在线学习正常帧差分布，按偏离程度判定变化
+
+固定的 DIFF_THRESHOLD 在夜视下会被传感器噪声、红外自动曝光跳变频繁越过，
+白天明亮画面又几乎碰不到。这里对每个 摄像头 × 尺度（相邻落盘帧 / 分析窗口首尾帧）
+× 光照模式 维护帧差的指数加权均值/方差，变化判定用 z = (diff - 均值) / 标准差 > NOISE_Z。
+
+- 光照模式：ir（夜视，画面无色彩）/ dark（彩色但很暗）/ bright
+- 帧差先去掉整体亮度偏移（自动曝光跳变不算运动）
+- 前后两帧光照模式不同（开关灯、切夜视）→ 不算变化
+- 样本不足 NOISE_MIN_SAMPLES 时退回摄像头的固定阈值
+- 模型按 key 存 NOISE_DIR/<key>.json（capture / stream / analyze 各写各的 key），跨进程/跨天延续
+"""
+
+import io, json, math
+from PIL import Image, ImageChops, ImageStat
+
+from config import *
+
+
+def load_model(key):
+    """{光照模式: {mean, var, n}}"""
+    try:
+        return json.loads((NOISE_DIR / f"{key}.json").read_text())
+    except:
+        return {}
+
+
+def save_model(key, model):
+    try:
+        NOISE_DIR.mkdir(parents=True, exist_ok=True)
+        (NOISE_DIR / f"{key}.json").write_text(json.dumps(model))
+    except Exception as e:
+        print(f"⚠️ 噪声模型保存失败: {e}")
+
+
+def lighting_mode(src):
+    """判断光照模式；src 可以是 JPEG 路径或 bytes"""
+    img = Image.open(io.BytesIO(src) if isinstance(src, bytes) else src)
+    img.draft("RGB", (64, 48))
+    small = img.convert("RGB").resize((32, 24))
+    r, g, b = small.split()
+    chroma = (ImageStat.Stat(ImageChops.difference(r, g)).mean[0]
+              + ImageStat.Stat(ImageChops.difference(g, b)).mean[0])
+    if chroma < NOISE_IR_CHROMA:
+        return "ir"
+    if ImageStat.Stat(small.convert("L")).mean[0] < NOISE_DARK_LUMA:
+        return "dark"
+    return "bright"
+
+
+def compensated_diff(a, b):
+    """去掉整体亮度偏移后的平均帧差（a/b 为同尺寸灰度缩略图）"""
+    shift = round(ImageStat.Stat(a).mean[0] - ImageStat.Stat(b).mean[0])
+    if shift:
+        b = b.point(lambda v: min(255, max(0, v + shift)))
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+
+def evaluate(model, mode, prev_mode, diff, fallback_threshold):
+    """判定一次帧差是否算“变化”，顺带更新 model（load_model 的结果），返回 (changed, reason)"""
+    if prev_mode and mode != prev_mode:
+        return False, f"光照切换 {prev_mode}→{mode}"
+
+    m = model.get(mode, {"mean": 0.0, "var": 0.0, "n": 0})
+    std = max(math.sqrt(m["var"]), NOISE_MIN_STD)
+    if m["n"] < NOISE_MIN_SAMPLES:
+        changed = diff > fallback_threshold
+        reason = f"学习中 {m['n']}/{NOISE_MIN_SAMPLES}"
+    else:
+        z = (diff - m["mean"]) / std
+        changed = z > NOISE_Z
+        reason = f"z={z:.1f} 底噪{m['mean']:.1f}±{std:.1f}"
+
+    # 学习：超出部分截断到 mean + Z·std，真实活动只会缓慢抬高底噪；前期加大步长尽快收敛
+    x = min(diff, m["mean"] + NOISE_Z * std) if m["n"] >= NOISE_MIN_SAMPLES else diff
+    alpha = max(NOISE_ALPHA, 1 / (m["n"] + 1))
+    delta = x - m["mean"]
+    m["mean"] += alpha * delta
+    m["var"] = (1 - alpha) * (m["var"] + alpha * delta * delta)
+    m["n"] += 1
+    model[mode] = m
+    return changed, reason
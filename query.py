@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""历史查询：把所有 ruirui_YYYY-MM-DD.md 增量建成 SQLite 索引，按区间/过滤/聚合查询
+
+索引记录每个日志文件已读到的字节位置，每次查询前只解析新追加的内容，
+查询本身不再读日志文件。
+
+用法（也可通过 report.py query ... 调用）:
+    query.py range --from 2026-09-01 --to 2026-09-30 --status sleeping
+    query.py range --days 7 --event 出门
+    query.py naps --days 30                  # 每天入睡（转入 sleeping）的时间
+    query.py agg --by day --status sleeping  # 按天/小时/状态/房间/陪伴聚合
+    query.py reindex
+"""
+
+import sys, re, json, time, sqlite3, argparse
+from datetime import datetime, timedelta
+
+from config import LOG_DIR, INDEX_DB, ANALYZE_EVERY_MIN
+from analytics import parse_line
+
+DAY_FILE_RE = re.compile(r"^ruirui_(\d{4}-\d{2}-\d{2})\.md$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    day TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    last TEXT                      -- 上一条记录 {id, status, room, companion, light}，用于续读
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    day TEXT NOT NULL,
+    time TEXT NOT NULL,
+    minute INTEGER NOT NULL,
+    kind TEXT,                     -- analyze / skip
+    status TEXT,
+    room TEXT,
+    companion TEXT,
+    light TEXT,
+    description TEXT,
+    event TEXT,
+    transition INTEGER NOT NULL    -- 1 = 与上一条状态不同
+);
+CREATE INDEX IF NOT EXISTS idx_entries_day ON entries(day, minute);
+CREATE INDEX IF NOT EXISTS idx_entries_status ON entries(status, day);
+"""
+
+
+def connect():
+    INDEX_DB.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(INDEX_DB)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def index_file(db, day, path):
+    """把某天日志从上次位置续读进索引，返回新增记录数"""
+    row = db.execute("SELECT offset, last FROM files WHERE day = ?", (day,)).fetchone()
+    offset, last = (row["offset"], json.loads(row["last"] or "{}")) if row else (0, {})
+    size = path.stat().st_size
+    if size < offset:
+        # 文件被重写 → 整天重建
+        db.execute("DELETE FROM entries WHERE day = ?", (day,))
+        offset, last = 0, {}
+    if size == offset:
+        return 0
+    if not last:
+        # 当天从头读：状态接着前一天最后一条算，跨天没变就不算转换
+        prev = db.execute("SELECT status FROM entries WHERE day < ? ORDER BY day DESC, minute DESC, id DESC"
+                          " LIMIT 1", (day,)).fetchone()
+        last = {"status": prev["status"]} if prev else {}
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # 只消费完整的行
+    added = 0
+    for line in data[:end].decode("utf-8").splitlines():
+        rec = parse_line(line)
+        if rec is None:
+            continue
+        if "time" not in rec:
+            if last.get("id"):
+                db.execute("UPDATE entries SET event = ? WHERE id = ?", (rec["event"], last["id"]))
+            continue
+        for k in ("room", "companion", "light"):
+            if rec.get(k) is None:
+                rec[k] = last.get(k)
+        cur = db.execute(
+            "INSERT INTO entries (day, time, minute, kind, status, room, companion, light,"
+            " description, event, transition) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            (day, rec["time"], rec["minute"], rec["kind"], rec["status"], rec["room"],
+             rec["companion"], rec["light"], rec.get("description"), None,
+             int("status" in last and rec["status"] != last["status"])))
+        last = {"id": cur.lastrowid, "status": rec["status"], "room": rec["room"],
+                "companion": rec["companion"], "light": rec["light"]}
+        added += 1
+    db.execute("INSERT OR REPLACE INTO files (day, offset, last) VALUES (?, ?, ?)",
+               (day, offset + end, json.dumps(last, ensure_ascii=False)))
+    return added
+
+
+def update_index(db):
+    added = 0
+    for path in sorted(LOG_DIR.glob("ruirui_*.md")):
+        m = DAY_FILE_RE.match(path.name)
+        if m:
+            added += index_file(db, m.group(1), path)
+    db.commit()
+    return added
+
+
+def date_range(args):
+    if args.days:
+        start = (datetime.now() - timedelta(days=args.days - 1)).strftime("%Y-%m-%d")
+        return start, datetime.now().strftime("%Y-%m-%d")
+    return args.start or "0000-00-00", args.end or "9999-99-99"
+
+
+def build_filters(args):
+    start, end = date_range(args)
+    where, params = ["day BETWEEN ? AND ?"], [start, end]
+    for col in ("status", "room", "companion"):
+        val = getattr(args, col)
+        if val:
+            where.append(f"{col} LIKE ?")
+            params.append(f"%{val}%")
+    if args.event:
+        where.append("event LIKE ?")
+        params.append(f"%{args.event}%")
+    if args.transitions:
+        where.append("transition = 1")
+    return " AND ".join(where), params
+
+
+def cmd_range(db, args):
+    where, params = build_filters(args)
+    rows = db.execute(f"SELECT * FROM entries WHERE {where} ORDER BY day, minute LIMIT ?",
+                      params + [args.limit]).fetchall()
+    for r in rows:
+        event = f"  ⚡{r['event']}" if r["event"] else ""
+        print(f"{r['day']} {r['time']} [{r['status']}] {r['room'] or ''} | "
+              f"{r['description'] or '(无变化)'} | {r['companion'] or ''}{event}")
+    return len(rows)
+
+
+def cmd_naps(db, args):
+    """每天转入 sleeping 的时间点"""
+    args.status, args.transitions = "sleeping", True
+    where, params = build_filters(args)
+    rows = db.execute(f"SELECT day, group_concat(time, ' ') AS starts, count(*) AS n"
+                      f" FROM entries WHERE {where} GROUP BY day ORDER BY day", params).fetchall()
+    for r in rows:
+        print(f"{r['day']}  {r['n']}次  {r['starts']}")
+    return len(rows)
+
+
+GROUP_EXPR = {
+    "day": "day",
+    "hour": "printf('%02d:00', minute / 60)",
+    "status": "status",
+    "room": "room",
+    "companion": "companion",
+}
+
+
+def cmd_agg(db, args):
+    """聚合：条数 ≈ 分析周期数，分钟数按每条覆盖 ANALYZE_EVERY_MIN 估算"""
+    where, params = build_filters(args)
+    expr = GROUP_EXPR[args.by]
+    rows = db.execute(f"SELECT {expr} AS k, count(*) AS n, sum(transition) AS t"
+                      f" FROM entries WHERE {where} GROUP BY k ORDER BY k", params).fetchall()
+    for r in rows:
+        print(f"{r['k']}\t{r['n']}条\t≈{r['n'] * ANALYZE_EVERY_MIN}min\t转换{r['t']}次")
+    return len(rows)
+
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("需要正整数")
+    return value
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(prog="query.py", description="锐锐历史日志查询")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for name in ("range", "naps", "agg"):
+        sp = sub.add_parser(name)
+        sp.add_argument("--from", dest="start", help="起始日期 YYYY-MM-DD")
+        sp.add_argument("--to", dest="end", help="结束日期 YYYY-MM-DD")
+        sp.add_argument("--days", type=positive_int, help="最近N天（含今天）")
+        sp.add_argument("--status")
+        sp.add_argument("--room")
+        sp.add_argument("--companion")
+        sp.add_argument("--event")
+        sp.add_argument("--transitions", action="store_true", help="只看状态转换")
+        sp.add_argument("--limit", type=int, default=500)
+        if name == "agg":
+            sp.add_argument("--by", choices=sorted(GROUP_EXPR), default="day")
+    sub.add_parser("reindex")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    t0 = time.time()
+    db = connect()
+    if args.cmd == "reindex":
+        db.executescript("DELETE FROM entries; DELETE FROM files;")
+    added = update_index(db)
+    t1 = time.time()
+    n = {"range": cmd_range, "naps": cmd_naps, "agg": cmd_agg}.get(args.cmd, lambda db, a: 0)(db, args)
+    t2 = time.time()
+    print(f"⏱️ 索引+{added}条 {1000 * (t1 - t0):.0f}ms | 查询{n}行 {1000 * (t2 - t1):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""回放：用录制的帧和录制的 Gemini / 猫眼结果，在模拟时钟下跑完整条流水线
+
+帧差 → L1/L2 判定 → 状态机 → 告警 全部走正式代码，不访问网络、不发通知、不 sleep，
+用来离线调 DIFF_THRESHOLD / NOISE_Z / FORCE_ANALYZE_MIN / 告警规则。
+
+用法:
+    replay.py <frames_dir> [--gemini gemini.jsonl] [--door door.jsonl]
+              [--set DIFF_THRESHOLD=6 --set FORCE_ANALYZE_MIN=20] [--json out.json] [--keep] [-q]
+
+frames_dir 里的帧：摄像头_YYYYmmdd-HHMM[SS].jpg（如 bedroom_20261019-0712.jpg）
+gemini.jsonl 每行 {"ts": "2026-10-19 07:10", "text": "卧室 | 一直在婴儿床里睡觉 | 无人 | 夜视"}
+door.jsonl   每行 {"ts": "2026-10-19 07:10", "stroller": true}
+每个分析时刻取不晚于该时刻的最近一条录制结果。
+"""
+
+import os, sys, re, io, json, time, shutil, tempfile, argparse, bisect, contextlib
+from datetime import datetime
+from pathlib import Path
+
+# 截图/日志/状态全部隔离到临时目录 —— 必须在导入 config 之前设好
+WORK_DIR = Path(tempfile.mkdtemp(prefix="ruirui_replay_"))
+os.environ.update({
+    "RUIRUI_CAPTURE_DIR": str(WORK_DIR / "captures"),
+    "RUIRUI_LOG_DIR": str(WORK_DIR / "logs"),
+    "RUIRUI_HEARTBEAT_FILE": str(WORK_DIR / "heartbeat"),
+    "RUIRUI_ARCHIVE": "0",
+    "RUIRUI_HA": "0",
+    "GEMINI_KEY_PATH": str(WORK_DIR / "gemini_key"),
+})
+
+import clock, config, capture, analyze, alert, state, analytics, noise, governor  # noqa: E402
+
+FRAME_RE = re.compile(r"^(.+)_(\d{8})-(\d{4}|\d{6})$")
+
+
+def load_frames(frames_dir):
+    """[(ts, cam, path)]，按时间排序；不认识的文件名和未登记的摄像头跳过"""
+    frames = []
+    for f in Path(frames_dir).glob("*.jpg"):
+        m = FRAME_RE.match(f.stem)
+        if not m or m.group(1) not in config.CAMERAS:
+            continue
+        hms = m.group(3).ljust(6, "0")
+        ts = datetime.strptime(m.group(2) + hms, "%Y%m%d%H%M%S").timestamp()
+        frames.append((ts, m.group(1), f))
+    return sorted(frames)
+
+
+def parse_ts(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.strptime(value, "%Y-%m-%d %H:%M").timestamp()
+
+
+def load_responses(path):
+    """jsonl → 按时间排序的 (ts 列表, 记录列表)"""
+    if not path:
+        return [], []
+    rows = sorted((json.loads(l) for l in Path(path).read_text().splitlines() if l.strip()),
+                  key=lambda r: parse_ts(r["ts"]))
+    return [parse_ts(r["ts"]) for r in rows], rows
+
+
+def latest_before(index, ts):
+    times, rows = index
+    i = bisect.bisect_right(times, ts) - 1
+    return rows[i] if i >= 0 else None
+
+
+def apply_overrides(pairs):
+    """--set KEY=VALUE 覆盖所有已导入模块里的同名配置（VALUE 按 JSON 解析）
+
+    和 tenants.activate 一样：模块里和 config 当前值是同一对象的同名常量才替换
+    """
+    for pair in pairs:
+        key, raw = pair.split("=", 1)
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        old = getattr(config, key)
+        for m in config.project_modules():
+            if getattr(m, key, None) is old:
+                setattr(m, key, value)
+        # 沿用全局阈值/配额的摄像头跟着改（同 config.py 末尾的档案覆盖）
+        for cam in config.CAMERAS.values():
+            if key == "DIFF_THRESHOLD" and cam["threshold"] == old:
+                cam["threshold"] = value
+            quota_key = "MAX_PER_CAM" if cam["role"] == "indoor" else "MAX_DOOR_FRAMES"
+            if key == quota_key and cam["quota"] == old:
+                cam["quota"] = value
+        print(f"⚙️ {key} = {value}（原 {old}）")
+
+
+def replay(frames, gemini_index, door_index):
+    result = {"gemini_calls": 0, "door_checks": 0, "alerts": [], "ticks": 0}
+
+    def sink(level, message):
+        result["alerts"].append({"time": clock.now().strftime("%Y-%m-%d %H:%M"),
+                                 "level": level, "message": message})
+
+    def replay_gemini(selected, gemini_key, width=None):
+        result["gemini_calls"] += 1
+        rec = latest_before(gemini_index, clock.time())
+        if rec is None:
+            raise ValueError("no recorded Gemini response")
+        usage = {"model": "replay", "latency_s": 0, "prompt_tokens": 0,
+                 "cached_tokens": 0, "output_tokens": 0}
+        return rec["text"], 0, usage
+
+    def replay_door(direction, gemini_key):
+        result["door_checks"] += 1
+        rec = latest_before(door_index, clock.time())
+        return bool(rec and rec.get("stroller")), int(rec is not None)
+
+    alert.set_sink(sink)
+    config.CAPTURE_DIR.mkdir(parents=True, exist_ok=True)
+    config.LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    # 按分钟分组，模拟 scheduler 每分钟一次的节奏
+    by_minute = {}
+    for ts, cam, path in frames:
+        by_minute.setdefault(int(ts // 60 * 60), []).append((cam, path))
+    start, end = min(by_minute), max(by_minute)
+
+    for minute_ts in range(start, end + 60, 60):
+        clock.set_time(minute_ts)
+        now = clock.now()
+        if now.hour < config.RUN_HOUR_START or now.hour >= config.RUN_HOUR_END:
+            continue
+        now_str = now.strftime("%H%M")
+
+        cap_state = capture.load_state()
+        for cam, path in by_minute.get(minute_ts, []):
+            res, output_path = capture.ingest_frame(
+                cam, config.CAMERAS[cam], path.read_bytes(), cap_state.get(f"last_{cam}"), now_str,
+                cap_state.get(f"mode_{cam}"), cap_state.get(f"prev_mode_{cam}"))
+            capture.remember_capture(cap_state, cam, res, output_path)
+            # 截图/引用文件的 mtime 对齐到模拟时间，get_recent_captures 按 mtime 取窗口
+            for f in config.CAPTURE_DIR.glob(f"{cam}_{now_str}.*"):
+                os.utime(f, (minute_ts, minute_ts))
+        cap_state["last_capture"] = now_str
+        cap_state["last_capture_ts"] = minute_ts
+        capture.save_state(cap_state)
+
+        if now.minute % config.ANALYZE_EVERY_MIN == 0:
+            capture.cleanup_captures(cap_state)  # 30分钟窗口，每个分析周期清一次足够
+            result["ticks"] += 1
+            analyze.run_analyze(gemini_fn=replay_gemini, door_fn=replay_door)
+
+    clock.reset()
+    alert.set_sink(None)
+
+    # 时间线：用本地统计从回放写出的日志里重建
+    result["days"] = {}
+    for log_file in sorted(config.LOG_DIR.glob("ruirui_*.md")):
+        day = log_file.stem.split("_", 1)[1]
+        stats = analytics.compute_stats(analytics.parse_log(log_file.read_text(encoding="utf-8")))
+        result["days"][day] = stats
+    return result
+
+
+def print_result(result, elapsed):
+    print("\n" + "=" * 40)
+    for day, stats in result["days"].items():
+        print(f"📅 {day}")
+        for seg in stats["segments"]:
+            print(f"  {seg['start']}-{seg['end']} {seg['status']}（{seg['room']}）")
+    print(f"🚨 告警 {len(result['alerts'])} 条")
+    for a in result["alerts"]:
+        print(f"  {a['time']} [{a['level']}] {a['message']}")
+    print(f"🤖 Gemini 调用 {result['gemini_calls']} 次 / 分析时刻 {result['ticks']} 个 | "
+          f"🚪 猫眼检查 {result['door_checks']} 次 | ⏱️ 回放耗时 {elapsed:.1f}s")
+
+
+def main():
+    p = argparse.ArgumentParser(prog="replay.py", description="锐锐流水线离线回放")
+    p.add_argument("frames_dir")
+    p.add_argument("--gemini", help="录制的 Gemini 结果 jsonl")
+    p.add_argument("--door", help="录制的猫眼结果 jsonl")
+    p.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖配置")
+    p.add_argument("--json", help="结果写入 JSON 文件")
+    p.add_argument("--keep", action="store_true", help="保留回放工作目录")
+    p.add_argument("-q", "--quiet", action="store_true", help="不打印流水线逐分钟输出")
+    args = p.parse_args()
+
+    (WORK_DIR / "gemini_key").write_text("replay")
+    apply_overrides(args.set)
+    frames = load_frames(args.frames_dir)
+    if not frames:
+        print("没有可回放的帧"); sys.exit(1)
+    print(f"▶️ 回放 {len(frames)} 帧，工作目录 {WORK_DIR}")
+
+    t0 = time.time()
+    out = contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext()
+    with out:
+        result = replay(frames, load_responses(args.gemini), load_responses(args.door))
+    print_result(result, time.time() - t0)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    if not args.keep:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """锐锐活动报告 - 用 Gemini 生成汇报"""
 
-import os, sys, requests, json, shutil
+import os, sys, requests, json, shutil, hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from config import GEMINI_KEY_PATH, LOG_DIR
+from config import GEMINI_KEY_PATH, LOG_DIR, REPORT_CACHE_FILE, REPORT_CACHE_DAYS
+from analytics import parse_line, parse_log, compute_stats, format_digest, fmt_minute
+from trends import compute_trend, format_trend
+from gemini import generate
 ARCHIVE_DIR = LOG_DIR
+REPORT_MODEL = "gemini-3.1-pro-preview"
 
 
 def load_key():
@@ -24,71 +28,171 @@ def read_log():
     return log_file.read_text(encoding="utf-8")
 
 
-def filter_last_hour(log_text):
-    """筛选最近一小时的记录"""
-    now = datetime.now()
-    one_hour_ago = now - timedelta(hours=1)
-    lines = []
-    for line in log_text.splitlines():
-        if not line.startswith("- "):
-            continue
-        try:
-            time_str = line.split("|")[0].replace("- ", "").strip()
-            t = datetime.strptime(time_str, "%H:%M").replace(
-                year=now.year, month=now.month, day=now.day)
-            if t >= one_hour_ago:
-                lines.append(line)
-        except:
-            continue
-    return "\n".join(lines)
-
-
 def ask_gemini(prompt, api_key):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3.1-pro-preview:generateContent?key={api_key}"
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
     try:
-        r = requests.post(url, json=payload, timeout=60)
-        r.raise_for_status()
-        return r.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
+        text, _ = generate(REPORT_MODEL, [{"text": prompt}], api_key, timeout=60)
+        return text
     except Exception as e:
         print(f"Gemini 请求失败: {e}")
         return None
 
 
-def hourly_report(api_key):
-    log = read_log()
-    recent = filter_last_hour(log)
-    if not recent:
-        print("过去一小时没有记录")
-        return
+# ── 报告缓存 ──
+# logs:    {day: {offset, lines}}   日志增量读取位置，只读追加部分
+# windows: {"day HH:MM-HH:MM": {hash, summary}}  每小时摘要
+# daily:   {day: {hash, report}}    全天报告
+# trends:  {"day Nd": {hash, report}} 周/月趋势报告
 
-    now = datetime.now()
-    hour_ago = now - timedelta(hours=1)
-    prompt = f"""以下是锐锐（8个月婴儿）过去一小时的活动记录：
+def load_cache():
+    try:
+        cache = json.loads(REPORT_CACHE_FILE.read_text())
+    except:
+        cache = {}
+    for k in ("logs", "windows", "daily", "trends"):
+        cache.setdefault(k, {})
+    return cache
+
+
+def save_cache(cache):
+    cutoff = (datetime.now() - timedelta(days=REPORT_CACHE_DAYS)).strftime("%Y-%m-%d")
+    for k in ("logs", "windows", "daily", "trends"):
+        cache[k] = {key: v for key, v in cache[k].items() if key[:10] >= cutoff}
+    REPORT_CACHE_FILE.parent.mkdir(exist_ok=True)
+    REPORT_CACHE_FILE.write_text(json.dumps(cache, ensure_ascii=False))
+
+
+def read_log_lines(cache, day):
+    """增量读某天日志的记录行：只解析上次读到位置之后追加的内容"""
+    log_file = LOG_DIR / f"ruirui_{day}.md"
+    if not log_file.exists():
+        return []
+    entry = cache["logs"].get(day, {"offset": 0, "lines": []})
+    size = log_file.stat().st_size
+    if size < entry["offset"]:
+        entry = {"offset": 0, "lines": []}  # 文件被重写
+    if size > entry["offset"]:
+        with open(log_file, "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # 只消费完整的行
+        entry["lines"] += [l for l in data[:end].decode("utf-8").splitlines()
+                           if l.startswith("- ") or l.startswith("  - ")]
+        entry["offset"] += end
+    cache["logs"][day] = entry
+    return entry["lines"]
 
-{recent}
+
+def window_lines(lines, start_min, end_min):
+    """[start_min, end_min) 内的记录行（EVENT 行跟随所属记录）"""
+    out, keep = [], False
+    for line in lines:
+        rec = parse_line(line)
+        if rec is None:
+            continue
+        if "time" in rec:
+            keep = start_min <= rec["minute"] < end_min
+        if keep:
+            out.append(line)
+    return out
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def summarize_window(cache, day, start_min, end_min, lines, api_key):
+    """某个时间窗的摘要：窗口 + 输入 hash 命中缓存则直接返回，返回 (summary, cached)"""
+    key = f"{day} {fmt_minute(start_min)}-{fmt_minute(end_min)}"
+    digest = text_hash("\n".join(lines))
+    hit = cache["windows"].get(key)
+    if hit and hit["hash"] == digest:
+        return hit["summary"], True
+
+    prompt = f"""以下是锐锐（8个月婴儿）{fmt_minute(start_min)}-{fmt_minute(end_min)} 的活动记录：
+
+{chr(10).join(lines)}
 
 请生成简洁的活动汇报，格式：
-👶 {hour_ago.strftime('%H:%M')}-{now.strftime('%H:%M')} 锐锐动态：
+👶 {fmt_minute(start_min)}-{fmt_minute(end_min)} 锐锐动态：
 - 用时间线展示活动变化
 - 状态没变就简单说"一直在睡"之类
 - 不要啰嗦"""
 
-    result = ask_gemini(prompt, api_key)
+    summary = ask_gemini(prompt, api_key)
+    if summary:
+        cache["windows"][key] = {"hash": digest, "summary": summary}
+    return summary, False
+
+
+def hourly_report(api_key, use_llm=True):
+    """上一个整点小时的汇报（crontab 整点调用）"""
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    end_min = now.hour * 60
+    start_min = max(0, end_min - 60)
+
+    cache = load_cache()
+    recent = window_lines(read_log_lines(cache, today), start_min, end_min)
+    if not recent:
+        save_cache(cache)
+        print("过去一小时没有记录")
+        return
+
+    if not use_llm:
+        save_cache(cache)
+        print(f"👶 {fmt_minute(start_min)}-{fmt_minute(end_min)} 锐锐动态：")
+        print(format_digest(compute_stats(parse_log("\n".join(recent)), end_min)))
+        return
+
+    result, cached = summarize_window(cache, today, start_min, end_min, recent, api_key)
+    save_cache(cache)
     if result:
-        print(result)
+        print(result + ("\n（♻️ 缓存）" if cached else ""))
 
 
-def daily_report(api_key):
-    log = read_log()
-    if not log.strip():
+def daily_report(api_key, use_llm=True):
+    """全天报告：由每小时摘要拼成，只有缺失或输入变了的小时才重新调用 LLM"""
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    cache = load_cache()
+    lines = read_log_lines(cache, today)
+    records = parse_log("\n".join(lines))
+    if not records:
+        save_cache(cache)
         print("今天没有记录")
         return
 
-    today = datetime.now().strftime("%Y-%m-%d")
-    prompt = f"""以下是锐锐（8个月婴儿）今天的全部活动记录：
+    # 统计和未满的小时都截到最后一条记录，而不是当前时刻：日志没变时窗口和输入不变，缓存才能命中
+    log_end = records[-1]["minute"] + 1
+    # 时长、次数、房间停留在本地精确计算，LLM 只负责叙述
+    digest = format_digest(compute_stats(records, log_end))
+    if not use_llm:
+        save_cache(cache)
+        print(f"📋 锐锐 {today} 全天统计")
+        print(digest)
+        return
+
+    summaries, reused = [], 0
+    for hour in range(24):
+        start_min, end_min = hour * 60, min((hour + 1) * 60, log_end)
+        if start_min >= end_min:
+            break
+        hour_lines = window_lines(lines, start_min, end_min)
+        if not hour_lines:
+            continue
+        summary, cached = summarize_window(cache, today, start_min, end_min, hour_lines, api_key)
+        reused += cached
+        if summary:
+            summaries.append(summary)
+    print(f"♻️ 小时摘要：复用{reused}段，新生成{len(summaries) - reused}段")
 
-{log}
+    prompt = f"""以下是锐锐（8个月婴儿）今天的活动统计（已精确计算，直接引用数字，不要重新计算）：
+
+{digest}
+
+以及每小时的活动摘要：
+
+{chr(10).join(summaries)}
 
 请生成全天活动报告，包含：
 1. 全天时间线（关键状态变化）
@@ -98,33 +202,107 @@ def daily_report(api_key):
 
 标题用：📋 锐锐 {today} 全天活动报告"""
 
-    result = ask_gemini(prompt, api_key)
+    digest_hash = text_hash(prompt)
+    hit = cache["daily"].get(today)
+    if hit and hit["hash"] == digest_hash:
+        result = hit["report"]
+        print("♻️ 全天报告输入未变，使用缓存")
+    else:
+        result = ask_gemini(prompt, api_key)
+        if result:
+            cache["daily"][today] = {"hash": digest_hash, "report": result}
+    save_cache(cache)
     if result:
         print(result)
 
     # 归档
+    log = read_log()
     archive_file = ARCHIVE_DIR / f"ruirui_{today}.md"
     archive_file.write_text(log, encoding="utf-8")
     print(f"\n📁 已归档到 {archive_file}")
 
-    # 清空日志，保留标题
-    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y年%-m月%-d日")
-    weekday = ["周一","周二","周三","周四","周五","周六","周日"][(datetime.now() + timedelta(days=1)).weekday()]
     # 日志已按天分文件，无需清空
     print("🧹 日志已清空")
 
 
+TREND_PERIODS = {"weekly": ("周", 7), "monthly": ("月", 30)}
+
+
+def trend_report(api_key, period, days=None, use_llm=True):
+    """周/月趋势：各天统计本地并行算好（按天缓存），LLM 只看汇总后的数字摘要"""
+    name, default_days = TREND_PERIODS[period]
+    days = days or default_days
+    today = datetime.now().strftime("%Y-%m-%d")
+    # 按天列还是按周分段：两周以内逐天，更长按7天一段
+    digest = format_trend(compute_trend(today, days, 1 if days <= 14 else 7))
+    if not use_llm:
+        print(f"📈 锐锐近{days}天趋势")
+        print(digest)
+        return
+
+    prompt = f"""以下是锐锐（8个月婴儿）近{days}天的作息统计（已精确计算，直接引用数字，不要重新计算）：
+
+{digest}
+
+说明：入睡时刻是当天第1/2/3觉的平均开始时间；独醒是独自清醒；变化是后半段相对前半段。
+
+请生成{name}度趋势报告，包含：
+1. 睡眠：总时长、觉数、每觉时长和入睡时间的变化趋势
+2. 独自清醒和外出频率的变化
+3. 值得注意的规律或异常（有数据支撑才说）
+4. 简洁明了，不要废话
+
+标题用：📈 锐锐{name}度趋势（{days}天）"""
+
+    key = f"{today} {days}d"
+    digest_hash = text_hash(prompt)
+    cache = load_cache()
+    hit = cache["trends"].get(key)
+    if hit and hit["hash"] == digest_hash:
+        result = hit["report"]
+        print("♻️ 趋势统计未变，使用缓存")
+    else:
+        result = ask_gemini(prompt, api_key)
+        if result:
+            cache["trends"][key] = {"hash": digest_hash, "report": result}
+    save_cache(cache)
+    if result:
+        print(result)
+
+
 def main():
-    if len(sys.argv) < 2:
-        print("用法: report.py [hourly|daily]"); sys.exit(1)
+    if sys.argv[1:2] == ["query"]:
+        # 历史查询走索引，不需要 Gemini key
+        from query import main as query_main
+        query_main(sys.argv[2:])
+        return
+
+    usage = "用法: report.py [hourly|daily|weekly|monthly] [--days N] [--no-llm] | report.py query ..."
+    argv = sys.argv[1:]
+    days = None
+    if "--days" in argv:
+        i = argv.index("--days")
+        try:
+            days = int(argv[i + 1])
+        except (IndexError, ValueError):
+            days = 0
+        if days <= 0:
+            print("--days 需要正整数"); print(usage); sys.exit(1)
+        argv = argv[:i] + argv[i + 2:]
+    args = [a for a in argv if not a.startswith("--")]
+    use_llm = "--no-llm" not in argv
+    if not args:
+        print(usage); sys.exit(1)
 
-    api_key = load_key()
-    cmd = sys.argv[1]
+    api_key = load_key() if use_llm else None
+    cmd = args[0]
 
     if cmd == "hourly":
-        hourly_report(api_key)
+        hourly_report(api_key, use_llm)
     elif cmd == "daily":
-        daily_report(api_key)
+        daily_report(api_key, use_llm)
+    elif cmd in TREND_PERIODS:
+        trend_report(api_key, cmd, days, use_llm)
     else:
         print(f"未知命令: {cmd}"); sys.exit(1)
 
@@ -3,14 +3,40 @@
 
 每分钟：capture.py 截图
 每10分钟：analyze.py 分析（帧差→Gemini→状态机→告警→EVENT）
+Home Assistant 报告上次分析后开过门、或上次分析因 Gemini 限速顺延：当分钟立即分析
+常驻循环（tenants.py / server.py --pipeline）某轮超过一分钟、跳过了分析时刻：下一轮补做
 """
 
-from datetime import datetime
-from config import RUN_HOUR_START, RUN_HOUR_END
+import json
+from datetime import datetime, timedelta
+from config import RUN_HOUR_START, RUN_HOUR_END, ANALYZE_EVERY_MIN, STATE_FILE
+import ha
 
 
-def main():
-    now = datetime.now()
+def analysis_due(minute):
+    if minute % ANALYZE_EVERY_MIN == 0:
+        return True
+    try:
+        deferred = json.loads(STATE_FILE.read_text()).get("analyze_deferred")
+    except:
+        deferred = False
+    return bool(deferred) or ha.door_pending()
+
+
+def missed_analysis(since, now):
+    """since 和 now 之间（不含两端）跳过的分钟里是否有分析时刻"""
+    t = since + timedelta(minutes=1)
+    while t < now:
+        if RUN_HOUR_START <= t.hour < RUN_HOUR_END and t.minute % ANALYZE_EVERY_MIN == 0:
+            return t
+        t += timedelta(minutes=1)
+    return None
+
+
+def main(now=None, since=None):
+    """now 由 tenants.py 按整轮统一给出，前面的户跑过了分钟边界也不会错过分析时刻；
+    since 是常驻循环上一轮的分钟，中间跳过的分析时刻这一轮补做"""
+    now = now or datetime.now()
     hour = now.hour
     minute = now.minute
 
@@ -22,8 +48,11 @@ def main():
     from capture import run_capture
     results = run_capture()
 
-    # 每10分钟：分析
-    if minute % 10 == 0:
+    # 每10分钟：分析（HA 门磁有变化、限速顺延时立即分析）
+    missed = since and missed_analysis(since, now)
+    if missed:
+        print(f"⏩ 上一轮超时，跳过了 {missed:%H:%M} 的分析，补做")
+    if missed or analysis_due(minute):
         from analyze import run_analyze
         run_analyze()
 
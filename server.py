@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""状态服务：HTTP 暴露当前状态、最近转换、健康、今日统计和每个摄像头的最新帧
+
+所有请求都从内存快照返回，快照只在流水线每轮跑完后刷新一次 ——
+客户端再多也不读盘、不碰摄像头。
+
+- GET /status                 JSON 快照；带 ETag，If-None-Match 命中返回 304
+- GET /status?wait=30         长轮询：ETag（If-None-Match 或 ?since=）没变就挂起到变化或超时
+- GET /events                 SSE：每次 ETag 变化推一条 status 事件
+
+ETag 只随宝宝状态和状态转换变化；健康、今日统计、最新帧每次刷新都会更新到快照里，
+但不换 ETag，不会每分钟唤醒长轮询 / SSE 客户端。
+- GET /frames/<摄像头>.jpg     最新帧（带 ETag）
+- GET /health                 只看健康部分
+
+每个请求都要带令牌（STATUS_TOKEN_PATH 文件内容）：Authorization: Bearer <令牌>，
+或 ?token=<令牌>（EventSource 不能带请求头）。跨域只允许 STATUS_CORS_ORIGIN 一个来源。
+
+用法:
+    python server.py                # 常驻：每分钟跑一轮 scheduler，跑完刷新快照（替代 crontab）
+    python server.py --no-pipeline  # 流水线仍由 crontab 跑，这里每 STATUS_REFRESH_SEC 从文件刷新
+"""
+
+import sys, json, time, hmac, hashlib, threading, traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from config import *
+from capture import load_state, resolve_frame
+from state import load_baby_state
+import analytics
+
+
+class Snapshot:
+    """流水线写、HTTP 线程读的内存快照"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.status = {}
+        self.body = b"{}"
+        self.etag = '"0"'
+        self.frames = {}  # {摄像头: (路径, etag, bytes)}
+
+    def refresh(self):
+        """从流水线的状态文件重建一次快照，状态或转换有变化才换 ETag 并唤醒等待者"""
+        cap_state = load_state()
+        baby = load_baby_state()
+        try:
+            day = json.loads(STATS_FILE.read_text())["daily"].get(datetime.now().strftime("%Y-%m-%d"), {})
+        except:
+            day = {}
+        today = analytics.day_stats()
+        heartbeat = None
+        try:
+            heartbeat = float(HEARTBEAT_FILE.read_text())
+        except:
+            pass
+
+        frames = {}
+        for name in CAMERAS:
+            path = cap_state.get(f"last_{name}")
+            if not path:
+                continue
+            old = self.frames.get(name)
+            if old and old[0] == path:
+                frames[name] = old
+                continue
+            try:
+                data = resolve_frame(path).read_bytes()
+                frames[name] = (path, f'"{hashlib.sha1(data).hexdigest()[:16]}"', data)
+            except:
+                if old:
+                    frames[name] = old
+
+        status = {
+            "baby": {k: baby.get(k) for k in ("status", "status_since", "room", "companion", "light",
+                                              "consecutive_unknown", "last_update")},
+            "transitions": baby.get("history", []),
+            "health": {
+                "heartbeat": heartbeat,
+                "last_capture": cap_state.get("last_capture_ts"),
+                "last_any_failure": cap_state.get("last_any_failure"),
+                "go2rtc_failures": cap_state.get("go2rtc_failures", 0),
+            },
+            "today": {
+                "calls": day.get("calls", 0),
+                "skips": day.get("skips", 0),
+                "cost_usd": day.get("cost_usd", 0.0),
+                "sleep_min": today.get("sleep_min"),
+                "awake_min": today.get("awake_min"),
+                "alone_awake_min": today.get("alone_awake_min"),
+                "nap_count": today.get("nap_count"),
+                "room_min": today.get("room_min"),
+                "segments": today.get("segments", []),
+            },
+            "frames": {name: {"url": f"/frames/{name}.jpg", "etag": f[1],
+                              "file": frame_name(f[0])} for name, f in frames.items()},
+        }
+        body = json.dumps(status, ensure_ascii=False, default=str).encode()
+        # last_update 每次分析都会变，不算状态变化
+        change = {"baby": {k: v for k, v in status["baby"].items() if k != "last_update"},
+                  "transitions": status["transitions"]}
+        change = json.dumps(change, ensure_ascii=False, sort_keys=True, default=str).encode()
+        etag = f'"{hashlib.sha1(change).hexdigest()[:16]}"'
+        with self.cond:
+            self.frames = frames
+            self.status, self.body = status, body
+            if etag != self.etag:
+                self.etag = etag
+                self.cond.notify_all()
+
+    def wait_change(self, etag, timeout):
+        """等到 ETag 不同于 etag 或超时，返回 (body, etag)"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.etag != etag, timeout=timeout)
+            return self.body, self.etag
+
+
+def frame_name(path):
+    return path.rsplit("/", 1)[-1]
+
+
+SNAPSHOT = Snapshot()
+TOKEN = None
+
+
+def load_token():
+    try:
+        return open(STATUS_TOKEN_PATH).read().strip() or None
+    except:
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_cors(self):
+        if STATUS_CORS_ORIGIN and self.headers.get("Origin") == STATUS_CORS_ORIGIN:
+            self.send_header("Access-Control-Allow-Origin", STATUS_CORS_ORIGIN)
+            self.send_header("Access-Control-Expose-Headers", "ETag")
+            self.send_header("Vary", "Origin")
+
+    def authorized(self, query):
+        given = query.get("token", [""])[0]
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            given = auth[len("Bearer "):].strip()
+        return bool(TOKEN) and hmac.compare_digest(given.encode(), TOKEN.encode())
+
+    def send_body(self, code, body, content_type="application/json; charset=utf-8", etag=None):
+        self.send_response(code)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_cors()
+        if code == 304:
+            self.end_headers()
+            return
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        """跨域预检：只对配置的来源放行"""
+        self.send_response(204 if STATUS_CORS_ORIGIN else 403)
+        if STATUS_CORS_ORIGIN and self.headers.get("Origin") == STATUS_CORS_ORIGIN:
+            self.send_cors()
+            self.send_header("Access-Control-Allow-Methods", "GET")
+            self.send_header("Access-Control-Allow-Headers", "Authorization, If-None-Match")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if not self.authorized(query):
+                return self.send_body(401, b'{"error": "unauthorized"}')
+            if url.path == "/status":
+                return self.get_status(query)
+            if url.path == "/health":
+                with SNAPSHOT.cond:
+                    body = json.dumps(SNAPSHOT.status.get("health", {})).encode()
+                return self.send_body(200, body)
+            if url.path == "/events":
+                return self.get_events()
+            if url.path.startswith("/frames/") and url.path.endswith(".jpg"):
+                return self.get_frame(url.path[len("/frames/"):-len(".jpg")])
+            self.send_body(404, b'{"error": "not found"}')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def get_status(self, query):
+        client_etag = self.headers.get("If-None-Match") or query.get("since", [None])[0]
+        try:
+            wait = float(query.get("wait", [0])[0])
+            if wait != wait:  # nan
+                raise ValueError
+        except ValueError:
+            return self.send_body(400, b'{"error": "bad wait"}')
+        wait = min(max(wait, 0.0), STATUS_LONGPOLL_MAX_SEC)
+        if wait > 0 and client_etag:
+            body, etag = SNAPSHOT.wait_change(client_etag, wait)
+        else:
+            with SNAPSHOT.cond:
+                body, etag = SNAPSHOT.body, SNAPSHOT.etag
+        if client_etag == etag:
+            return self.send_body(304, b"", etag=etag)
+        self.send_body(200, body, etag=etag)
+
+    def get_frame(self, name):
+        with SNAPSHOT.cond:
+            frame = SNAPSHOT.frames.get(name)
+        if not frame:
+            return self.send_body(404, b'{"error": "no frame"}')
+        if self.headers.get("If-None-Match") == frame[1]:
+            return self.send_body(304, b"", etag=frame[1])
+        self.send_body(200, frame[2], content_type="image/jpeg", etag=frame[1])
+
+    def get_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_cors()
+        self.end_headers()
+        self.close_connection = True
+        etag = None
+        while True:
+            body, new_etag = SNAPSHOT.wait_change(etag, STATUS_SSE_KEEPALIVE_SEC)
+            if new_etag == etag:
+                self.wfile.write(b": keepalive\n\n")
+            else:
+                etag = new_etag
+                self.wfile.write(b"event: status\nid: " + etag.strip('"').encode()
+                                 + b"\ndata: " + body + b"\n\n")
+            self.wfile.flush()
+
+
+def serve():
+    server = ThreadingHTTPServer((STATUS_HOST, STATUS_PORT), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="status-http", daemon=True).start()
+    print(f"🌐 状态服务 http://{STATUS_HOST}:{STATUS_PORT}/status")
+    return server
+
+
+def run_pipeline_loop():
+    """每分钟整点跑一轮 scheduler（和 crontab 同样的节奏），跑完刷新快照；
+    某轮超过一分钟跳过的分析时刻，下一轮补做（见 scheduler.main 的 since）"""
+    import scheduler
+    last = None
+    while True:
+        now = datetime.now().replace(second=0, microsecond=0)
+        try:
+            scheduler.main(now=now, since=last)
+        except Exception:
+            traceback.print_exc()
+        last = now
+        SNAPSHOT.refresh()
+        time.sleep(60 - time.time() % 60)
+
+
+def run_refresh_loop():
+    while True:
+        time.sleep(STATUS_REFRESH_SEC)
+        SNAPSHOT.refresh()
+
+
+def main():
+    global TOKEN
+    TOKEN = load_token()
+    if not TOKEN:
+        sys.exit(f"❌ 没有状态服务令牌（{STATUS_TOKEN_PATH}），拒绝启动")
+    CAPTURE_DIR.mkdir(exist_ok=True)
+    SNAPSHOT.refresh()
+    serve()
+    try:
+        if "--no-pipeline" in sys.argv:
+            run_refresh_loop()
+        else:
+            run_pipeline_loop()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,8 @@
 
 import json, time
 from datetime import datetime
-from config import STATE_FILE
+from config import STATE_FILE, STATE_CONFIRM_WEIGHT, STATE_IMMEDIATE, CONFIDENCE_WEIGHTS
+import clock
 
 STATES = ["sleeping", "playing", "held", "eating", "alone_awake", "unknown", "out"]
 
@@ -14,6 +15,7 @@ DEFAULT_STATE = {
     "light": "unknown",
     "door_activity": None,
     "consecutive_unknown": 0,
+    "pending": None,  # 待确认的新状态 {status, weight, count, since, description}
     "history": [],  # 最近10条状态变更
 }
 
@@ -38,8 +40,8 @@ def save_baby_state(baby_state):
 def parse_gemini_result(text):
     """解析 Gemini 输出为结构化状态
     
-    输入格式: 房间 | 活动描述 | 陪伴 | 环境
-    输出: dict with status, room, companion, light, description
+    输入格式: 房间 | 活动描述 | 陪伴 | 环境 [| 置信度]
+    输出: dict with status, room, companion, light, description, confidence
     """
     parts = [p.strip() for p in text.split("|")]
     if len(parts) < 4:
@@ -75,15 +77,53 @@ def parse_gemini_result(text):
         "companion": companion_raw,
         "light": light_raw,
         "description": desc,
+        "confidence": parts[4] if len(parts) > 4 else None,
     }
 
 
+def observe(baby_state, parsed, now):
+    """平滑：一次观测是否足以确认状态切换，返回要切换到的状态或 None
+
+    新状态的证据按置信度加权累积（CONFIDENCE_WEIGHTS），达到 STATE_CONFIRM_WEIGHT 才确认；
+    中途又看到当前状态或别的状态，之前的累积作废；unknown（一张糊帧）不算反证，跳过。
+    单次误读不再产生一对来回转换。
+    例外：STATE_IMMEDIATE（独自清醒）和从 unknown 出发的切换立即确认。
+    """
+    old_status = baby_state["status"]
+    new_status = parsed["status"]
+    if new_status == "unknown" and old_status != "unknown":
+        return None
+    if new_status == "unknown" or new_status == old_status:
+        baby_state["pending"] = None
+        return None
+    if new_status in STATE_IMMEDIATE or old_status == "unknown":
+        baby_state["pending"] = None
+        return new_status
+
+    confidence = parsed.get("confidence") or ""
+    level = next((k for k in ("高", "中", "低") if k in confidence), None)
+    weight = CONFIDENCE_WEIGHTS.get(level, CONFIDENCE_WEIGHTS[None])
+    pending = baby_state.get("pending")
+    if pending and pending["status"] == new_status:
+        pending["weight"] = round(pending["weight"] + weight, 2)
+        pending["count"] += 1
+    else:
+        pending = {"status": new_status, "weight": weight, "count": 1, "since": now,
+                   "description": parsed.get("description", "")}
+    if pending["weight"] >= STATE_CONFIRM_WEIGHT:
+        baby_state["pending"] = None
+        return new_status
+    baby_state["pending"] = pending
+    return None
+
+
 def update_state(baby_state, parsed):
-    """更新状态机，返回 (new_state, transitions)"""
+    """更新状态机（经 observe 平滑），返回 (new_state, transitions)"""
     transitions = []
     old_status = baby_state["status"]
     new_status = parsed["status"]
-    now = time.time()
+    now = clock.time()
+    pending = baby_state.get("pending")
 
     # 更新连续 unknown 计数
     if new_status == "unknown":
@@ -92,30 +132,38 @@ def update_state(baby_state, parsed):
         baby_state["consecutive_unknown"] = 0
 
     # 检测状态变更
-    if new_status != old_status and new_status != "unknown":
+    confirmed = observe(baby_state, parsed, now)
+    if confirmed:
+        # 多次观测才确认的，状态从第一次看到时算起
+        since = pending["since"] if pending and pending["status"] == confirmed else now
         transition = {
             "from": old_status,
-            "to": new_status,
-            "time": datetime.now().strftime("%H:%M"),
+            "to": confirmed,
+            "time": clock.now().strftime("%H:%M"),
             "ts": now,
             "description": parsed.get("description", ""),
         }
         transitions.append(transition)
 
         # 更新状态
-        baby_state["status"] = new_status
-        baby_state["status_since"] = now
+        baby_state["status"] = confirmed
+        baby_state["status_since"] = since
 
         # 保留最近10条历史
         baby_state.setdefault("history", [])
         baby_state["history"].append(transition)
         baby_state["history"] = baby_state["history"][-10:]
 
-    elif new_status != "unknown":
-        # 状态没变但更新时间
-        baby_state["status"] = new_status
+    # 更新上下文：只采用已确认或与当前状态一致的观测，待确认的读数不让房间/陪伴来回跳
+    if confirmed or new_status == baby_state["status"]:
+        update_context(baby_state, parsed)
+
+    baby_state["last_update"] = now
+
+    return baby_state, transitions
+
 
-    # 更新上下文
+def update_context(baby_state, parsed):
     if parsed.get("room") and parsed["room"] != "unknown":
         baby_state["room"] = parsed["room"]
     if parsed.get("companion"):
@@ -123,14 +171,10 @@ def update_state(baby_state, parsed):
     if parsed.get("light"):
         baby_state["light"] = parsed["light"]
 
-    baby_state["last_update"] = now
-
-    return baby_state, transitions
-
 
 def get_status_duration_min(baby_state):
     """当前状态持续了多少分钟"""
     since = baby_state.get("status_since", 0)
     if since == 0:
         return 0
-    return (time.time() - since) / 60
+    return (clock.time() - since) / 60
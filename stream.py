@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""流式采集：对每个 go2rtc 摄像头保持 MJPEG 长连接
+
+snapshot 模式下每分钟请求 /api/frame.jpeg，冷流要重新建立米家 P2P 会话，慢且容易超时。
+stream 模式由本进程常驻，持有 /api/stream.mjpeg 长连接：
+- 增量解析帧，按 STREAM_PERSIST_SEC 落盘到 CAPTURE_DIR（文件名格式与 capture.py 一致）
+- 落盘后同步写采集状态（last_/mode_ 等，同 capture.py）：状态服务的最新帧跟着流走，
+  流断开回退截图时也接着流的最后一帧做帧差
+- 定期写 STREAM_STATUS_FILE，capture.py 据此跳过已由流覆盖的摄像头
+
+用法: python stream.py
+"""
+
+import time, json, threading, requests
+from datetime import datetime
+
+from config import *
+from capture import (iter_jpeg_frames, load_thumb, store_frame, detect_change, prev_thumb_path,
+                     remember_capture, save_state)
+import noise
+
+# 各摄像头线程共用一个采集状态文件
+_state_lock = threading.Lock()
+
+
+def stream_url(cam):
+    if cam["source"] == "go2rtc":
+        return f"{GO2RTC_URL}/api/stream.mjpeg?src={cam['src']}"
+    return cam["src"]
+
+
+class StreamWorker(threading.Thread):
+    """单个摄像头的长连接读流线程"""
+
+    def __init__(self, name, cam):
+        super().__init__(name=f"stream-{name}", daemon=True)
+        self.cam_name = name
+        self.cam = cam
+        self.url = stream_url(cam)
+        self.latest_ts = 0
+        self.frames = 0
+        self.connected = False
+        self.last_diff = None
+        self.last_changed = None
+        self.last_mode = None
+        self.last_persist_ts = 0
+        self.prev_thumb = None   # 上一次落盘（含 .ref）的缩略图和光照模式：帧差、运动序列、噪声模型对比它
+        self.prev_mode = None
+        self.ref_thumb = None    # 上一张整帧（.ref 的引用目标）：只用来决定是否落整帧
+        self.last_path = None
+        self.stop_event = threading.Event()
+
+    def run(self):
+        failures = 0
+        while not self.stop_event.is_set():
+            try:
+                with requests.get(self.url, stream=True, timeout=(10, 30)) as r:
+                    r.raise_for_status()
+                    self.connected = True
+                    failures = 0
+                    print(f"📡 {self.cam_name}: 已连接 {self.url}")
+                    for img in iter_jpeg_frames(r.iter_content(chunk_size=16384)):
+                        self.on_frame(img)
+                        if self.stop_event.is_set():
+                            return
+                raise ConnectionError("stream closed")
+            except Exception as e:
+                self.connected = False
+                wait = STREAM_RECONNECT_BACKOFF[min(failures, len(STREAM_RECONNECT_BACKOFF) - 1)]
+                failures += 1
+                print(f"❌ {self.cam_name}: {e}，{wait}s 后重连")
+                self.stop_event.wait(wait)
+
+    def on_frame(self, img_bytes):
+        if len(img_bytes) < 1000:
+            return
+        now = time.time()
+        self.latest_ts = now
+        self.frames += 1
+        if now - self.last_persist_ts >= STREAM_PERSIST_SEC:
+            self.last_persist_ts = now
+            self.persist(img_bytes, now)
+
+    def persist(self, img_bytes, ts):
+        """落盘一帧，帧差对比上一次落盘（含 .ref）；无变化只写引用"""
+        fmt = "%H%M" if STREAM_PERSIST_SEC >= 60 else "%H%M%S"
+        now_str = datetime.fromtimestamp(ts).strftime(fmt)
+        try:
+            thumb = load_thumb(img_bytes, self.cam.get("roi"))
+            if self.prev_thumb:
+                check = detect_change(self.cam_name, self.cam, self.prev_thumb, thumb, img_bytes,
+                                      self.prev_mode, ts, self.ref_thumb, self.last_mode)
+            else:
+                check = {"diff": 999.0, "changed": True, "keep": True, "mode": None, "reason": ""}
+            diff, changed = check["diff"], check["changed"]
+            output_path, is_ref = store_frame(self.cam_name, img_bytes, now_str, diff,
+                                              check["keep"], self.last_path)
+            mode = check["mode"] or (noise.lighting_mode(img_bytes) if NOISE_ENABLED else None)
+            self.prev_thumb, self.prev_mode = thumb, mode
+            if not is_ref:
+                self.ref_thumb = thumb
+                self.last_path = output_path
+                self.last_mode = mode
+            self.last_diff = diff
+            self.last_changed = changed
+            self.save_capture_state(thumb, {"ok": True, "mode": mode}, None if is_ref else output_path)
+            print(f"{'🔴' if changed else '⚪'} {self.cam_name}: {len(img_bytes)//1024}KB diff={diff:.1f}"
+                  + (f" {check['reason']}" if check["reason"] else "")
+                  + (" → 引用上一帧" if is_ref else ""))
+        except Exception as e:
+            print(f"❌ {self.cam_name}: 落盘失败: {e}")
+
+    def save_capture_state(self, thumb, result, output_path):
+        """和 capture.run_capture 一样记下上一次采集和引用目标"""
+        thumb.save(prev_thumb_path(self.cam_name))
+        with _state_lock:
+            try:
+                state = json.loads(STATE_FILE.read_text()) if STATE_FILE.exists() else {}
+            except ValueError:
+                return  # 别的进程正在写，不能拿空状态覆盖；下一帧再记
+            remember_capture(state, self.cam_name, result, output_path)
+            save_state(state)
+
+    def status(self):
+        return {
+            "connected": self.connected,
+            "latest_ts": self.latest_ts,
+            "frames": self.frames,
+            "diff": self.last_diff,
+            "changed": self.last_changed,
+        }
+
+
+def load_stream_status():
+    try:
+        return json.loads(STREAM_STATUS_FILE.read_text())
+    except:
+        return {}
+
+
+def fresh_streams():
+    """流进程仍在正常出帧的摄像头名集合"""
+    status = load_stream_status()
+    now = time.time()
+    return {name for name, s in status.items()
+            if s.get("connected") and now - s.get("latest_ts", 0) < STREAM_STALE_SEC}
+
+
+def start_workers():
+    workers = {}
+    for name, cam in cameras(polled=True):
+        if cam["source"] in ("go2rtc", "mjpeg"):
+            workers[name] = StreamWorker(name, cam)
+            workers[name].start()
+    return workers
+
+
+def run_streams():
+    CAPTURE_DIR.mkdir(exist_ok=True)
+    workers = start_workers()
+    if not workers:
+        print("没有可流式采集的摄像头")
+        return
+    try:
+        while True:
+            status = {name: w.status() for name, w in workers.items()}
+            STREAM_STATUS_FILE.write_text(json.dumps(status))
+            HEARTBEAT_FILE.write_text(str(time.time()))
+            time.sleep(STREAM_STATUS_SEC)
+    except KeyboardInterrupt:
+        for w in workers.values():
+            w.stop_event.set()
+
+
+if __name__ == "__main__":
+    run_streams()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""多户：一个进程按档案轮流跑几户的流水线（代替每户一个 crontab + 冷启动的 Python）
+
+档案文件见 config.py（RUIRUI_PROFILES）。每户的配置由 config.py 按户重新执行得到，
+轮到某户时把它的配置写进各模块（和 replay --set 同一做法），跑完一轮 scheduler 再换下一户：
+- 隔离：截图、日志、状态、归档、运动序列、HA 快照、告警 webhook 都按户的配置走，启动时检查路径不重叠
+- 共用：已导入的模块、HTTP 连接池（gemini / capture 的 SESSION）、工作线程池、Gemini 按户公平限速
+- 每分钟各户依次跑一轮，起始户轮换，避免总是同一户先占 Gemini 额度；这一轮的分钟数统一算一次，
+  前面的户跑过了分钟边界，后面的户也不会错过分析时刻；整轮超过一分钟跳过的分析时刻，下一轮补做
+- Gemini 限速不排队：超出份额的户本轮分析顺延到下一分钟（排队只会卡住唯一的线程）
+
+各模块在导入时用 from config import * 绑定常量，所以同一时刻只能有一户生效：户与户串行，
+一轮里某户卡住会推迟后面的户。
+
+用法:
+    RUIRUI_PROFILES=profiles.json python tenants.py         # 常驻，每分钟轮一遍
+    RUIRUI_PROFILES=profiles.json python tenants.py once    # 只跑一轮（可放进单个 crontab）
+    RUIRUI_PROFILES=profiles.json python tenants.py list    # 打印各户路径/摄像头
+"""
+
+import sys, time, runpy, traceback
+from datetime import datetime
+
+import config
+import capture, analyze, ha, gemini  # noqa: F401  导入后才能按户写配置
+import scheduler
+
+# 每户必须不同的路径
+ISOLATED = ("CAPTURE_DIR", "LOG_DIR", "FRAME_ARCHIVE_DIR", "MOTION_DIR", "HEARTBEAT_FILE")
+# 进程级设置，模块导入时就用掉了，不能按户不同
+SHARED = ("MOTION_GRID", "MOTION_CADENCE_SEC", "CAPTURE_WORKERS", "GEMINI_RATE_PER_MIN",
+          "STATUS_HOST", "STATUS_PORT")
+
+_active = None      # 当前生效户名
+_namespaces = {}    # {户: 配置常量}
+_ha_cache = {}      # {户: (ha._states, ha._fetched_at)}
+
+
+def profile_namespace(name):
+    """按户重新执行 config.py，只保留大写常量"""
+    ns = runpy.run_path(config.__file__, init_globals={"PROFILE": name})
+    return {k: v for k, v in ns.items() if k.isupper()}
+
+
+def load_tenants():
+    profiles = config.load_profiles().get("profiles", {})
+    if not profiles:
+        sys.exit("没有档案：用 RUIRUI_PROFILES 指向档案文件（见 config.py）")
+    base = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+    for name in profiles:
+        _namespaces[name] = profile_namespace(name)
+
+    for key in ISOLATED:
+        owners = {}
+        for name, ns in _namespaces.items():
+            owners.setdefault(str(ns[key]), []).append(name)
+        clash = [f"{path}（{'、'.join(names)}）" for path, names in owners.items() if len(names) > 1]
+        if clash:
+            sys.exit(f"❌ {key} 多户重叠：{'; '.join(clash)}，请在档案 env 里分开")
+    for key in SHARED:
+        differ = [name for name, ns in _namespaces.items() if ns[key] != base[key]]
+        if differ:
+            sys.exit(f"❌ {key} 是进程级设置，不能按户设置（{'、'.join(differ)}）")
+    return list(profiles)
+
+
+def activate(name):
+    """把某户的配置写进所有已导入的模块：模块里和当前生效值是同一对象的同名常量才替换"""
+    global _active
+    if name == _active:
+        return
+    current = _namespaces[_active] if _active else {k: getattr(config, k) for k in dir(config) if k.isupper()}
+    target = _namespaces[name]
+    for m in config.project_modules():
+        for key, value in target.items():
+            if key in current and getattr(m, key, None) is current[key]:
+                setattr(m, key, value)
+
+    # 导入时由配置派生的模块状态
+    analyze.PROMPT = analyze.build_prompt()
+    if _active:
+        _ha_cache[_active] = (ha._states, ha._fetched_at)
+    ha._states, ha._fetched_at = _ha_cache.get(name, ({}, 0.0))
+
+    _active = name
+    target["CAPTURE_DIR"].mkdir(parents=True, exist_ok=True)
+    target["LOG_DIR"].mkdir(parents=True, exist_ok=True)
+
+
+class TenantOutput:
+    """每行输出加户名前缀（户与户串行，替换 sys.stdout 即可）"""
+
+    def __init__(self, stream, name):
+        self.stream, self.prefix, self.at_line_start = stream, f"[{name}] ", True
+
+    def write(self, text):
+        for piece in text.splitlines(keepends=True):
+            if self.at_line_start:
+                self.stream.write(self.prefix)
+            self.stream.write(piece)
+            self.at_line_start = piece.endswith("\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_tick(tenants, offset=0, since=None):
+    """各户依次跑一轮 scheduler，从第 offset 户开始；since 是上一轮的分钟，返回这一轮的分钟"""
+    order = tenants[offset % len(tenants):] + tenants[:offset % len(tenants)]
+    now = datetime.now().replace(second=0, microsecond=0)
+    stdout = sys.stdout
+    for name in order:
+        t0 = time.time()
+        activate(name)
+        sys.stdout = TenantOutput(stdout, name)
+        try:
+            scheduler.main(now=now, since=since)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+        finally:
+            sys.stdout = stdout
+        elapsed = time.time() - t0
+        if elapsed > 30:
+            print(f"⚠️ {name} 本轮用时{elapsed:.0f}s")
+    return now
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "run"
+    tenants = load_tenants()
+    gemini.LIMITER.blocking = False
+    if cmd == "list":
+        for name in tenants:
+            ns = _namespaces[name]
+            cams = "、".join(f"{n}({c['source']})" for n, c in ns["CAMERAS"].items())
+            print(f"🏠 {name}: 截图 {ns['CAPTURE_DIR']} | 日志 {ns['LOG_DIR']} | 摄像头 {cams}")
+        print(f"Gemini 限速: {config.GEMINI_RATE_PER_MIN or '不限'}/min，{len(tenants)}户平分")
+        return
+    if cmd == "once":
+        run_tick(tenants)
+        return
+
+    print(f"🏘️ {len(tenants)}户：{'、'.join(tenants)}")
+    tick, last = 0, None
+    try:
+        while True:
+            last = run_tick(tenants, tick, last)
+            tick += 1
+            time.sleep(60 - time.time() % 60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
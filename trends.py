@@ -0,0 +1,196 @@
+"""周/月趋势：跨天统计入睡时间、每觉时长、总睡眠、独自清醒、外出频率，不经过 LLM
+
+- 每天先压成一条小摘要（day_summary），按日志文件 (大小, mtime) 和影响摘要的设置缓存在
+  TREND_CACHE_FILE，日志和设置都没变的天不再解析；今天还在写，不缓存
+- 缓存没命中的天用进程池并行解析（TREND_WORKERS 个进程）
+- 再按天/按周分段汇总成紧凑的数字摘要（format_trend），report.py 只把这段摘要交给 LLM 叙述
+"""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from config import TREND_CACHE_FILE, TREND_WORKERS, TREND_MIN_NAP_MIN, ANALYZE_EVERY_MIN
+from analytics import day_log_path, parse_log, compute_stats, fmt_minute, fmt_duration, MAX_GAP_MIN
+
+# 改了这些设置，缓存的每日摘要就不对了
+SUMMARY_SETTINGS = [TREND_MIN_NAP_MIN, MAX_GAP_MIN, ANALYZE_EVERY_MIN]
+
+
+def to_minute(hhmm):
+    hh, mm = hhmm.split(":")
+    return int(hh) * 60 + int(mm)
+
+
+def day_summary(day):
+    """某天的紧凑摘要；没有日志返回 None（进程池 worker 调用，只依赖参数和日志文件）"""
+    path = day_log_path(day)
+    if not path.exists():
+        return None
+    end_minute = None
+    if day == datetime.now().strftime("%Y-%m-%d"):
+        now = datetime.now()
+        end_minute = now.hour * 60 + now.minute
+    stats = compute_stats(parse_log(path.read_text(encoding="utf-8")), end_minute)
+    if not stats["records"]:
+        return None
+    alone = [s for s in stats["segments"] if s["status"] == "alone_awake"]
+    return {
+        "day": day,
+        "sleep_min": stats["sleep_min"],
+        "naps": [[to_minute(n["start"]), n["minutes"]] for n in stats["naps"]
+                 if n["minutes"] >= TREND_MIN_NAP_MIN],
+        "alone_awake": len(alone),
+        "alone_awake_min": stats["alone_awake_min"],
+        "outings": len(stats["outings"]),
+        "out_min": sum(o["minutes"] for o in stats["outings"] if o["minutes"] is not None),
+    }
+
+
+def file_signature(day):
+    try:
+        st = day_log_path(day).stat()
+        return [st.st_size, st.st_mtime_ns, SUMMARY_SETTINGS]
+    except FileNotFoundError:
+        return None
+
+
+def load_cache():
+    try:
+        return json.loads(TREND_CACHE_FILE.read_text())
+    except:
+        return {}
+
+
+def summarize_days(days):
+    """[(day, 摘要或 None)]：缓存命中的直接用，其余并行解析"""
+    cache = load_cache()
+    today = datetime.now().strftime("%Y-%m-%d")
+    result, stale, missing = {}, [], 0
+    for day in days:
+        sig = file_signature(day)
+        hit = cache.get(day)
+        if sig is None:
+            result[day] = None
+            missing += 1
+        elif day != today and hit and hit["sig"] == sig:
+            result[day] = hit["summary"]
+        else:
+            stale.append(day)
+
+    if len(stale) > 1 and TREND_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=min(TREND_WORKERS, len(stale))) as pool:
+            fresh = list(pool.map(day_summary, stale, chunksize=max(1, len(stale) // (TREND_WORKERS * 4))))
+    else:
+        fresh = [day_summary(day) for day in stale]
+
+    for day, summary in zip(stale, fresh):
+        result[day] = summary
+        if day != today:
+            cache[day] = {"sig": file_signature(day), "summary": summary}
+    if stale:
+        TREND_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        TREND_CACHE_FILE.write_text(json.dumps(cache))
+    print(f"📈 {len(days)}天：缓存命中{len(days) - len(stale) - missing}天，重新解析{len(stale)}天，无日志{missing}天")
+    return [(day, result[day]) for day in days]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def bucket_stats(summaries):
+    """一段日子的汇总（只算有记录的天）"""
+    days = [s for s in summaries if s]
+    naps = [n for s in days for n in s["naps"]]
+    starts = []  # 第 i 觉的平均入睡时刻
+    for i in range(max((len(s["naps"]) for s in days), default=0)):
+        starts.append(mean([s["naps"][i][0] for s in days if len(s["naps"]) > i]))
+    outings = sum(s["outings"] for s in days)
+    return {
+        "days": len(days),
+        "sleep_min": mean([s["sleep_min"] for s in days]),
+        "naps_per_day": mean([len(s["naps"]) for s in days]),
+        "nap_min": mean([n[1] for n in naps]),
+        "nap_starts": starts,
+        "alone_awake": sum(s["alone_awake"] for s in days),
+        "alone_awake_min": sum(s["alone_awake_min"] for s in days),
+        "outings": outings,
+        "outings_per_day": outings / len(days) if days else None,
+        "out_min": sum(s["out_min"] for s in days) / outings if outings else None,
+    }
+
+
+def fmt_opt(value, fmt):
+    return "-" if value is None else fmt(value)
+
+
+def fmt_bucket(b):
+    if not b["days"]:
+        return "无记录"
+    starts = "/".join(fmt_minute(round(m)) for m in b["nap_starts"][:3]) or "-"
+    return (f"日均睡眠{fmt_duration(round(b['sleep_min']))} "
+            f"{b['naps_per_day']:.1f}觉×{fmt_opt(b['nap_min'], lambda m: fmt_duration(round(m)))} "
+            f"入睡{starts} 独醒{b['alone_awake']}次{fmt_duration(b['alone_awake_min'])} "
+            f"外出{b['outings']}次")
+
+
+def fmt_delta(a, b, fmt):
+    if a is None or b is None:
+        return "-"
+    d = b - a
+    return ("+" if d >= 0 else "-") + fmt(abs(d))
+
+
+def compute_trend(end_day, days, bucket_days):
+    """end_day 往前 days 天的趋势：{start, end, total, buckets: [(标签, 汇总)], first_half, second_half}"""
+    end = datetime.strptime(end_day, "%Y-%m-%d")
+    day_list = [(end - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1)]
+    summaries = [s for _, s in summarize_days(day_list)]
+
+    buckets = []
+    for i in range(len(day_list) % bucket_days or bucket_days, len(day_list) + 1, bucket_days):
+        chunk = range(max(0, i - bucket_days), i)
+        first, last = day_list[chunk[0]][5:], day_list[chunk[-1]][5:]
+        label = first if first == last else f"{first}~{last}"
+        buckets.append((label, bucket_stats([summaries[j] for j in chunk])))
+
+    half = len(summaries) // 2
+    return {
+        "start": day_list[0], "end": day_list[-1],
+        "total": bucket_stats(summaries),
+        "buckets": buckets,
+        "first_half": bucket_stats(summaries[:half]),
+        "second_half": bucket_stats(summaries[half:]),
+    }
+
+
+def format_trend(trend):
+    """给 LLM 看的紧凑数字摘要（也是 --no-llm 的输出）"""
+    total = trend["total"]
+    span = (datetime.strptime(trend["end"], "%Y-%m-%d") - datetime.strptime(trend["start"], "%Y-%m-%d")).days + 1
+    lines = [f"{trend['start']} ~ {trend['end']}，有记录{total['days']}/{span}天"]
+    if not total["days"]:
+        return "\n".join(lines)
+    starts = "、".join(f"第{i + 1}觉 {fmt_minute(round(m))}" for i, m in enumerate(total["nap_starts"][:3]))
+    lines += [
+        f"整体：{fmt_bucket(total)}",
+        f"入睡时刻：{starts or '无'}",
+        f"外出：日均{total['outings_per_day']:.1f}次，平均每次{fmt_opt(total['out_min'], lambda m: fmt_duration(round(m)))}",
+        "分段：",
+    ]
+    lines += [f"  {label} {fmt_bucket(b)}" for label, b in trend["buckets"]]
+
+    a, b = trend["first_half"], trend["second_half"]
+    if a["days"] and b["days"]:
+        dur = lambda m: fmt_duration(round(m))
+        first_start = lambda x: x["nap_starts"][0] if x["nap_starts"] else None
+        lines.append(
+            "变化（后半段 vs 前半段）："
+            f"日均睡眠{fmt_delta(a['sleep_min'], b['sleep_min'], dur)}，"
+            f"每天觉数{fmt_delta(a['naps_per_day'], b['naps_per_day'], lambda x: f'{x:.1f}')}，"
+            f"每觉{fmt_delta(a['nap_min'], b['nap_min'], dur)}，"
+            f"第1觉入睡{fmt_delta(first_start(a), first_start(b), dur)}，"
+            f"独自清醒{fmt_delta(a['alone_awake'] / a['days'], b['alone_awake'] / b['days'], lambda x: f'{x:.1f}')}次/天，"
+            f"外出{fmt_delta(a['outings_per_day'], b['outings_per_day'], lambda x: f'{x:.1f}')}次/天")
+    return "\n".join(lines)